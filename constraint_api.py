@@ -1,15 +1,30 @@
 # MIT 6.034 Lab 3: Constraint Satisfaction Problems
 
+from collections import deque
+from collections.abc import MutableMapping
 from copy import deepcopy
+from heapq import heapify, heappop, heappush, heapreplace
+from itertools import product
 
 class Constraint :
     def __init__(self, var1, var2, constraint_fn) :
         self.var1 = var1
         self.var2 = var2
         self.constraint_fn = constraint_fn
+        self.reversed_from = None
 
     def reverse(self) :
-        return Constraint(self.var2, self.var1, lambda a,b: self.constraint_fn(b,a))
+        reverse = Constraint(self.var2, self.var1, ReversedFunction(self.constraint_fn))
+        reverse.reversed_from = self
+        return reverse
+
+    def base_fn(self) :
+        """Returns the constraint function this constraint was built from,
+        following reversals back to the original constraint."""
+        constraint = self
+        while constraint.reversed_from is not None:
+            constraint = constraint.reversed_from
+        return constraint.constraint_fn
 
     def check(self, val1, val2) :
         "Returns True if values satisfy constraint_fn, otherwise False"
@@ -24,7 +39,25 @@ class Constraint :
         return (isinstance_Constraint(other)
                 and self.var1 == other.var1
                 and self.var2 == other.var2
-                and self.constraint_fn.__code__.co_code == other.constraint_fn.__code__.co_code)
+                and _function_code(self.constraint_fn) == _function_code(other.constraint_fn))
+
+
+class ReversedFunction :
+    """The constraint function of a reversed constraint: calls fn with its
+    two arguments swapped.  Unlike a lambda, it can be pickled (whenever fn
+    can), so reversed constraints can be sent to other processes."""
+    def __init__(self, fn) :
+        self.fn = fn
+        self.__name__ = fn.__name__ + '_reversed'
+
+    def __call__(self, a, b) :
+        return self.fn(b, a)
+
+def _function_code(fn) :
+    "Returns what Constraint.__eq__ compares to tell constraint functions apart."
+    if isinstance(fn, ReversedFunction):
+        return ('reversed', _function_code(fn.fn))
+    return fn.__code__.co_code
 
 
 def constraint_equal(a,b) :
@@ -34,26 +67,925 @@ def constraint_different(a,b) :
     return a != b
 
 
+class NaryConstraint :
+    """A global constraint over any number of variables.  constraint_fn
+    takes one value per variable, in the order of the scope (variables).
+
+    Every global constraint provides check(assignments) and filter(csp);
+    ConstraintSatisfactionProblem.add_global_constraint accepts any of
+    them."""
+
+    def __init__(self, variables, constraint_fn) :
+        self.variables = list(variables)
+        self.constraint_fn = constraint_fn
+        self._residues = {} # (position, value) -> last supporting tuple
+
+    def check(self, assignments) :
+        """Returns False if every variable in the scope is assigned and the
+        values violate the constraint, otherwise True"""
+        if not all(var in assignments for var in self.variables):
+            return True
+        return self.is_satisfied(tuple(assignments[var] for var in self.variables))
+
+    def is_satisfied(self, values) :
+        "Returns True if the tuple of values (in scope order) is allowed."
+        return bool(self.constraint_fn(*values))
+
+    def filter(self, csp) :
+        """Enforces generalized arc consistency: removes each value that
+        appears in no allowed tuple of values from the current domains.
+        Returns a sorted list of the variables whose domains were reduced.
+        If a domain is reduced to size 0, returns None."""
+        domains = [csp.get_domain(var) for var in self.variables]
+        live = [set(domain) for domain in domains]
+        reduced = []
+        changed = True
+        while changed:
+            changed = False
+            for i, var in enumerate(self.variables):
+                for val in domains[i]:
+                    if not self._find_support(i, val, domains, live):
+                        csp.eliminate(var, val)
+                        live[i].discard(val)
+                        changed = True
+                        if var not in reduced:
+                            reduced.append(var)
+                domains[i] = csp.get_domain(var)
+                if not domains[i]:
+                    return None
+        return sorted(reduced)
+
+    def _find_support(self, i, val, domains, live) :
+        """Returns True if some allowed tuple with val at position i uses only
+        live values, checking the cached residue first."""
+        residue = self._residues.get((i, val))
+        if residue is not None and all(v in values for v, values in zip(residue, live)):
+            return True
+        others = domains[:i] + [[val]] + domains[i+1:]
+        for values in product(*others):
+            if self.is_satisfied(values):
+                self._residues[(i, val)] = values
+                return True
+        return False
+
+    def __str__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__,
+                               ', '.join(map(str, self.variables)),
+                               self.constraint_fn.__name__)
+    __repr__ = __str__
+
+    def __eq__(self, other):
+        return (is_class_instance(other, self.__class__.__name__)
+                and self.variables == other.variables
+                and self.constraint_fn.__code__.co_code == other.constraint_fn.__code__.co_code)
+
+
+class TableConstraint(NaryConstraint) :
+    """A global constraint given extensionally, by the list of allowed tuples
+    of values (in the order of the scope).  Each position keeps an index
+    from value to the ids of the tuples containing it, so looking for a
+    support only visits tuples that can use the value."""
+
+    def __init__(self, variables, allowed_tuples) :
+        NaryConstraint.__init__(self, variables, None)
+        self.tuples = [tuple(t) for t in allowed_tuples]
+        self._allowed = set(self.tuples)
+        self._index = [{} for _ in self.variables]
+        for tuple_id, values in enumerate(self.tuples):
+            for i, val in enumerate(values):
+                self._index[i].setdefault(val, []).append(tuple_id)
+
+    def is_satisfied(self, values) :
+        return tuple(values) in self._allowed
+
+    def check(self, assignments) :
+        """Returns False if no allowed tuple agrees with the assigned
+        variables in the scope, otherwise True"""
+        assigned = [(i, assignments[var]) for i, var in enumerate(self.variables)
+                    if var in assignments]
+        if not assigned:
+            return True
+        i, val = min(assigned, key=lambda p: len(self._index[p[0]].get(p[1], ())))
+        for tuple_id in self._index[i].get(val, ()):
+            values = self.tuples[tuple_id]
+            if all(values[j] == v for j, v in assigned):
+                return True
+        return False
+
+    def _find_support(self, i, val, domains, live) :
+        residue = self._residues.get((i, val))
+        if residue is not None and all(v in values for v, values in zip(residue, live)):
+            return True
+        for tuple_id in self._index[i].get(val, ()):
+            values = self.tuples[tuple_id]
+            if all(v in allowed for v, allowed in zip(values, live)):
+                self._residues[(i, val)] = values
+                return True
+        return False
+
+    def __str__(self):
+        return 'TableConstraint(%s, %i tuples)' % (', '.join(map(str, self.variables)),
+                                                   len(self.tuples))
+    __repr__ = __str__
+
+    def __eq__(self, other):
+        return (is_class_instance(other, 'TableConstraint')
+                and self.variables == other.variables
+                and self._allowed == other._allowed)
+
+
+def _all_distinct(*values) :
+    return len(set(values)) == len(values)
+
+
+class AllDifferent(NaryConstraint) :
+    """A global constraint requiring every variable in its scope to take a
+    different value.  One AllDifferent replaces the n(n-1)/2 pairwise
+    constraint_different constraints, and its filter removes every value
+    that cannot appear in any solution of the constraint (Regin's matching
+    algorithm) rather than only the values of assigned variables."""
+
+    def __init__(self, variables) :
+        NaryConstraint.__init__(self, variables, _all_distinct)
+        self._matching = {} # last maximum matching, reused as a warm start
+
+    def check(self, assignments) :
+        """Returns False if two assigned variables in the scope share a
+        value, otherwise True"""
+        seen = set()
+        for var in self.variables:
+            if var in assignments:
+                if assignments[var] in seen:
+                    return False
+                seen.add(assignments[var])
+        return True
+
+    def filter(self, csp) :
+        """Removes every value that belongs to no maximum matching between
+        the scope and its domain values.  Returns a sorted list of the
+        variables whose domains were reduced.  If the constraint cannot be
+        satisfied, empties the domain of an unmatched variable and returns
+        None."""
+        variables = self.variables
+        domains = dict((var, csp.get_domain(var)) for var in variables)
+        match_var = {}
+        match_val = {}
+        for var, val in self._matching.items():
+            if var in domains and val in domains[var] and val not in match_val:
+                match_var[var] = val
+                match_val[val] = var
+        for var in variables:
+            if var not in match_var and not _augment(var, domains, match_var, match_val):
+                for val in domains[var]:
+                    csp.eliminate(var, val)
+                return None
+        self._matching = match_var
+
+        # Number the vertices (variables, then values) of the bipartite
+        # graph.  Matched edges point from a variable to its value, the other
+        # edges from a value to the variables whose domains contain it.
+        node = dict((var, i) for i, var in enumerate(variables))
+        value_node = {}
+        for var in variables:
+            for val in domains[var]:
+                if val not in value_node:
+                    value_node[val] = len(node) + len(value_node)
+        edges = [[] for _ in range(len(node) + len(value_node))]
+        for var in variables:
+            for val in domains[var]:
+                if match_var[var] == val:
+                    edges[node[var]].append(value_node[val])
+                else:
+                    edges[value_node[val]].append(node[var])
+
+        # An unmatched edge survives if it lies on an alternating path from
+        # a free value or on an alternating cycle (inside one SCC).
+        reachable = set(value_node[val] for val in value_node if val not in match_val)
+        frontier = list(reachable)
+        while frontier:
+            for j in edges[frontier.pop()]:
+                if j not in reachable:
+                    reachable.add(j)
+                    frontier.append(j)
+        component = _strongly_connected_components(edges)
+
+        reduced = []
+        for var in variables:
+            i = node[var]
+            for val in domains[var]:
+                j = value_node[val]
+                if (val != match_var[var] and j not in reachable
+                        and component[i] != component[j]):
+                    csp.eliminate(var, val)
+                    if var not in reduced:
+                        reduced.append(var)
+        return sorted(reduced)
+
+    def __str__(self):
+        return 'AllDifferent(%s)' % ', '.join(map(str, self.variables))
+    __repr__ = __str__
+
+
+def _augment(root, domains, match_var, match_val) :
+    """Looks for an augmenting path from the unmatched variable root and
+    flips it into the matching.  Returns True if one was found."""
+    visited = set()
+    stack = [(root, iter(domains[root]))]
+    through = [] # through[i]: value leading from stack[i] to stack[i+1]
+    while stack:
+        var, values = stack[-1]
+        for val in values:
+            if val in visited:
+                continue
+            visited.add(val)
+            owner = match_val.get(val)
+            if owner is None:
+                through.append(val)
+                for (path_var, _), path_val in zip(stack, through):
+                    match_var[path_var] = path_val
+                    match_val[path_val] = path_var
+                return True
+            stack.append((owner, iter(domains[owner])))
+            through.append(val)
+            break
+        else:
+            stack.pop()
+            if through:
+                through.pop()
+    return False
+
+def _strongly_connected_components(edges) :
+    """Returns a list mapping each vertex of the directed graph given as
+    adjacency lists to the index of its strongly connected component
+    (iterative Tarjan)."""
+    n = len(edges)
+    index = [None] * n
+    lowlink = [0] * n
+    component = [None] * n
+    on_stack = [False] * n
+    stack = []
+    counter = 0
+    components = 0
+    for start in range(n):
+        if index[start] is not None:
+            continue
+        work = [(start, 0)]
+        while work:
+            v, k = work.pop()
+            if k == 0:
+                index[v] = lowlink[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            else:
+                lowlink[v] = min(lowlink[v], lowlink[edges[v][k - 1]])
+            for k in range(k, len(edges[v])):
+                w = edges[v][k]
+                if index[w] is None:
+                    work.append((v, k + 1))
+                    work.append((w, 0))
+                    break
+                elif on_stack[w]:
+                    lowlink[v] = min(lowlink[v], index[w])
+            else:
+                if lowlink[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = components
+                        if w == v:
+                            break
+                    components += 1
+    return component
+
+
+# Placeholder recorded on the trail for a domain that did not exist yet
+_MISSING = object()
+
+
+class _DomainsView(MutableMapping) :
+    """The .domains attribute of a problem: a dictionary mapping each variable
+    to its domain list.  Reading an entry returns a new list, as get_domain
+    does.  Assigning or deleting an entry updates the problem through its own
+    methods, so bookkeeping such as the set of empty domains stays current.
+    Compare with == like a dict; use dict(csp.domains) for a plain
+    dictionary."""
+    def __init__(self, csp) :
+        self._csp = csp
+
+    def _store(self):
+        csp = self._csp
+        return csp._masks if csp._compact else csp._domains
+
+    def __getitem__(self, var):
+        if var not in self._store():
+            raise KeyError(var)
+        return self._csp._read_domain(var)
+
+    def __setitem__(self, var, values):
+        self._csp._put_domain(var, values)
+
+    def __delitem__(self, var):
+        if var not in self._store():
+            raise KeyError(var)
+        self._csp._drop_domain(var)
+
+    def __iter__(self):
+        return iter(self._store())
+
+    def __len__(self):
+        return len(self._store())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class _WeightLog :
+    """The variables whose constraint weights have grown, oldest first, shared
+    by a problem and its copies so their variable orderings can catch up.
+    Only the newest entries are kept: start is the position of the oldest
+    kept entry in the whole log."""
+    def __init__(self) :
+        self.start = 0
+        self.entries = []
+
+    def end(self):
+        return self.start + len(self.entries)
+
+    def add(self, variables, limit):
+        "Logs the variables, dropping old entries if more than limit are kept."
+        self.entries.extend(variables)
+        if len(self.entries) > limit:
+            drop = len(self.entries) - limit // 2
+            del self.entries[:drop]
+            self.start += drop
+
+    def since(self, position):
+        """Returns the variables logged from position on, or None if some of
+        them have already been dropped."""
+        if position < self.start:
+            return None
+        return self.entries[position - self.start:]
+
 class ConstraintSatisfactionProblem :
     def __init__(self, variables, constraints=[]) :
+        self._trail = None
+        self._compact = False
+        self._order_key = None
+        self._changed = None
+        self._weights = {}
+        self._weight_log = _WeightLog()
         self.variables = sorted(variables[:])
         self.constraints = deepcopy(constraints)
+        self.global_constraints = []
         self.unassigned_vars = self.variables[:]
         self.domains = deepcopy({})
         self.assignments = deepcopy({})
 
+    # Problems are copy-on-write: copy() shares the variable list, the
+    # constraint network, the assignment dict, the unassigned_vars list and
+    # every domain list with the original, and each mutator materializes a
+    # private copy of the piece it is about to change.  _owned_domains holds
+    # the variables whose domain list belongs to this problem alone; the
+    # _owns_* flags do the same for the other shared containers.  The
+    # .assignments and .unassigned_vars getters take ownership before
+    # handing out their container, since callers may change it in place.
+
+    @property
+    def domains(self):
+        return _DomainsView(self)
+
+    @domains.setter
+    def domains(self, domains_dict):
+        if self._compact:
+            self._values, self._positions, self._masks = {}, {}, {}
+            self._owns_interning = True
+            for var, values in domains_dict.items():
+                self._intern(var, values)
+        else:
+            self._domains = dict(domains_dict)
+            self._owned_domains = set()
+        self._find_empty_domains()
+
+    @property
+    def assignments(self):
+        return self._own_assignments()
+
+    @assignments.setter
+    def assignments(self, assignments_dict):
+        self._assignments = assignments_dict
+        self._owns_assignments = True
+
+    @property
+    def unassigned_vars(self):
+        return self._own_unassigned_vars()
+
+    @unassigned_vars.setter
+    def unassigned_vars(self, unassigned_list):
+        self._unassigned_vars = unassigned_list
+        self._owns_unassigned = True
+        if self._order_key is not None:
+            self._build_order_heap()
+
+    def _own_domain(self, var):
+        "Returns var's domain list, copying it first if it is shared."
+        values = self._domains[var]
+        if var not in self._owned_domains:
+            values = values[:]
+            self._domains[var] = values
+            self._owned_domains.add(var)
+        return values
+
+    def _own_assignments(self):
+        if not self._owns_assignments:
+            self._assignments = dict(self._assignments)
+            self._owns_assignments = True
+        return self._assignments
+
+    def _own_unassigned_vars(self):
+        if not self._owns_unassigned:
+            self._unassigned_vars = self._unassigned_vars[:]
+            self._owns_unassigned = True
+        return self._unassigned_vars
+
+    def _own_network(self):
+        "Gives this problem a private constraint list and adjacency index."
+        if not self._owns_network:
+            self._constraints = self._constraints[:]
+            self._outgoing = dict((var, cs[:]) for var, cs in self._outgoing.items())
+            self._incoming = dict((var, cs[:]) for var, cs in self._incoming.items())
+            self._neighbors = dict(self._neighbors)
+            self._supports = dict(self._supports)
+            self._global_constraints = self._global_constraints[:]
+            self._globals_of = dict((var, gs[:]) for var, gs in self._globals_of.items())
+            self._owns_network = True
+
+    # In the optional compact domain store (see use_compact_domains), each
+    # variable's values are interned when its domain is set: _values[var] is
+    # the tuple of distinct values, _positions[var] maps each value to its
+    # index, and the live domain is the bitmask _masks[var].  Removing a
+    # value, testing emptiness and measuring size are integer operations.
+    # The interning tables are shared between copies like the domain lists.
+
+    def use_compact_domains(self):
+        """Switches this problem to the compact (bitmask) domain store,
+        interning the current domains.  Domain values must be hashable.
+        get_domain and .domains still return lists."""
+        if not self._compact:
+            domains = self._domains
+            self._compact = True
+            self._domains = None
+            self.domains = domains
+        return self
+
+    def _own_interning(self):
+        if not self._owns_interning:
+            self._values = dict(self._values)
+            self._positions = dict(self._positions)
+            self._owns_interning = True
+
+    def _intern(self, var, values):
+        "Interns var's domain values and marks all of them as live."
+        self._own_interning()
+        positions = {}
+        for val in values:
+            positions.setdefault(val, len(positions))
+        self._values[var] = tuple(positions)
+        self._positions[var] = positions
+        self._masks[var] = (1 << len(positions)) - 1
+        self._note_domain(var)
+
+    def domain_size(self, var):
+        "Returns the number of values in the variable's domain."
+        if self._compact:
+            return bin(self._masks.get(var, 0)).count('1')
+        return len(self._domains.get(var, ()))
+
+    # _empty holds the variables whose domains are empty, in the order they
+    # were emptied (a dict used as an ordered set).  Every method that
+    # changes a domain keeps it up to date, and so do writes to .domains,
+    # which go through _put_domain and _drop_domain, so emptiness tests are
+    # O(1).
+
+    def has_empty_domain(self):
+        "Returns True if some variable's domain is empty, otherwise False"
+        return bool(self._empty)
+
+    def first_wiped_out_var(self):
+        """Returns the variable whose domain was emptied first among those
+        that are empty now (e.g. the one that made propagation fail), or
+        None if no domain is empty."""
+        for var in self._empty:
+            return var
+        return None
+
+    def _note_domain(self, var):
+        "Updates the empty-domain set after var's domain changed."
+        if self._compact:
+            empty = var in self._masks and not self._masks[var]
+        else:
+            empty = var in self._domains and not self._domains[var]
+        if empty:
+            self._empty.setdefault(var, None)
+        else:
+            self._empty.pop(var, None)
+
+    def _find_empty_domains(self):
+        "Rebuilds the empty-domain set from scratch."
+        if self._compact:
+            domains = self._masks
+        else:
+            domains = self._domains
+        self._empty = dict((var, None) for var in domains if not domains[var])
+
+    def snapshot(self):
+        """Returns a hashable snapshot of every variable's domain, in the
+        order of self.variables (None for a variable with no domain).  In the
+        compact store, each entry is the pair (interned values, mask), so
+        taking a snapshot copies no values."""
+        if self._compact:
+            masks, values = self._masks, self._values
+            return tuple((values[var], masks[var]) if var in masks else None
+                         for var in self.variables)
+        domains = self._domains
+        return tuple(tuple(domains[var]) if var in domains else None
+                     for var in self.variables)
+
+    def restore(self, snapshot):
+        "Restores the domains recorded by snapshot()."
+        for var, domain in zip(self.variables, snapshot):
+            if domain is None:
+                continue
+            if self._compact:
+                values, mask = domain
+                if self._values.get(var) is values:
+                    self._record('mask', var, self._masks[var])
+                else: # var's domain was set again since the snapshot
+                    self._record('intern', var, (self._values[var],
+                                                 self._positions[var],
+                                                 self._masks[var])
+                                 if var in self._masks else _MISSING)
+                    self._own_interning()
+                    self._values[var] = values
+                    self._positions[var] = dict((val, i) for i, val in enumerate(values))
+                self._masks[var] = mask
+            else:
+                self._record('domain', var, self._domains.get(var, _MISSING))
+                self._domains[var] = list(domain)
+                self._owned_domains.add(var)
+            self._note_domain(var)
+            self._touch(var)
+        return self
+
+    def _record(self, *entry):
+        if self._trail is not None:
+            self._trail.append(entry)
+
+    # Variable ordering: set_variable_order(key_fn) makes
+    # pop_next_unassigned_var return the unassigned variable with the
+    # smallest key_fn(csp, var), using a lazy heap of (key, rank, var)
+    # entries shared copy-on-write between copies.  rank is the variable's
+    # position in unassigned_vars when the order was set and breaks ties;
+    # popping a variable removes it from _order_rank, which therefore also
+    # holds the variables still waiting, so dead heap entries are recognized
+    # in O(1).  A fresh entry is pushed whenever a variable's domain changes
+    # (_changed) or one of its constraint weights grows (_weight_log, which
+    # is bounded: a problem that falls behind it refreshes every key), so
+    # keys may only decrease on those events; an entry whose key has grown
+    # is refreshed when it reaches the top of the heap.
+
+    def set_variable_order(self, key_fn):
+        """Makes pop_next_unassigned_var choose the unassigned variable
+        minimizing key_fn(csp, var) instead of the first one.  Pass None to
+        restore the default order."""
+        self._order_key = key_fn
+        if key_fn is None:
+            self._changed = None
+        else:
+            self._build_order_heap()
+        return self
+
+    def _build_order_heap(self):
+        key_fn = self._order_key
+        self._order_rank = dict((var, rank) for rank, var in enumerate(self._unassigned_vars))
+        self._order_heap = [(key_fn(self, var), rank, var)
+                            for rank, var in enumerate(self._unassigned_vars)]
+        heapify(self._order_heap)
+        self._owns_order = True
+        self._changed = set()
+        self._weight_seen = self._weight_log.end()
+
+    def _own_order(self):
+        if not self._owns_order:
+            self._order_heap = self._order_heap[:]
+            self._order_rank = dict(self._order_rank)
+            self._owns_order = True
+
+    def _touch(self, var):
+        "Notes that var's domain changed, for the variable ordering."
+        if self._changed is not None:
+            self._changed.add(var)
+
+    def _pop_ordered_var(self):
+        key_fn = self._order_key
+        self._own_order()
+        heap = self._order_heap
+        rank = self._order_rank
+        assignments = self._assignments
+        stale = self._changed
+        grown = self._weight_log.since(self._weight_seen)
+        stale.update(rank if grown is None else grown)
+        self._weight_seen = self._weight_log.end()
+        for var in stale:
+            if var in rank and var not in assignments:
+                heappush(heap, (key_fn(self, var), rank[var], var))
+        self._changed = set()
+        while heap:
+            key, var_rank, var = heap[0]
+            if var not in rank or var in assignments:
+                heappop(heap)
+                continue
+            current = key_fn(self, var)
+            if current != key:
+                heapreplace(heap, (current, var_rank, var))
+                continue
+            heappop(heap)
+            self._record('rank', var, rank.pop(var))
+            unassigned_vars = self._own_unassigned_vars()
+            i = unassigned_vars.index(var)
+            self._record('unassigned', var, i)
+            del unassigned_vars[i]
+            return var
+        return None
+
+    # Constraint weights count the failures (domain wipeouts) each
+    # constraint has caused, for weighted-degree orderings.  They are
+    # learned across the whole search, so every copy shares them; the
+    # solvers call fork_weights on their search copy, leaving the weights
+    # of the problem they were given unchanged.
+
+    def increment_weight(self, scope):
+        "Adds one to the weight of the constraint(s) over the given variables."
+        key = frozenset(scope)
+        self._weights[key] = self._weights.get(key, 1) + 1
+        if self._order_key is not None: # only orderings read the log
+            self._weight_log.add(key, 2 * len(self.variables) + 16)
+        return self
+
+    def get_weight(self, scope):
+        "Returns the weight of the constraint(s) over the given variables."
+        return self._weights.get(frozenset(scope), 1)
+
+    def fork_weights(self):
+        """Gives this problem its own copy of the constraint weights, shared
+        only with copies made from it afterwards, so a search can learn
+        weights without changing those of the problem it started from."""
+        self._weights = dict(self._weights)
+        self._weight_log = _WeightLog()
+        if self._order_key is not None:
+            self._weight_seen = 0
+        return self
+
+    # While a trail is active, every change to domains, assignments and
+    # unassigned_vars appends an undo record to self._trail, so a solver can
+    # search in place and roll the problem back to any checkpoint.
+
+    def start_trail(self):
+        "Starts recording changes so they can be undone with undo_to."
+        self._trail = []
+        return self
+
+    def stop_trail(self):
+        "Stops recording changes and discards the trail."
+        self._trail = None
+        return self
+
+    def checkpoint(self):
+        "Returns a marker for the current state, to be passed to undo_to."
+        if self._trail is None:
+            raise AttributeError("Can't checkpoint: no trail has been started.")
+        return len(self._trail)
+
+    def undo_to(self, mark):
+        """Undoes every recorded change made since checkpoint() returned
+        mark, restoring domains, assignments and unassigned_vars."""
+        trail = self._trail
+        while len(trail) > mark:
+            entry = trail.pop()
+            kind, var = entry[0], entry[1]
+            if kind == 'eliminate':
+                self._own_domain(var).insert(entry[2], entry[3])
+                self._empty.pop(var, None)
+            elif kind == 'domain':
+                if entry[2] is _MISSING:
+                    del self._domains[var]
+                else:
+                    self._domains[var] = entry[2]
+                self._owned_domains.discard(var)
+                self._note_domain(var)
+            elif kind == 'domains':
+                self._domains = entry[2]
+                self._owned_domains = set()
+                self._find_empty_domains()
+            elif kind == 'mask':
+                if entry[2] is _MISSING:
+                    del self._masks[var]
+                else:
+                    self._masks[var] = entry[2]
+                self._note_domain(var)
+            elif kind == 'intern':
+                self._own_interning()
+                if entry[2] is _MISSING:
+                    del self._values[var], self._positions[var], self._masks[var]
+                else:
+                    (self._values[var], self._positions[var],
+                     self._masks[var]) = entry[2]
+                self._note_domain(var)
+            elif kind == 'interned':
+                self._values, self._positions, self._masks = entry[2]
+                self._owns_interning = False
+                self._find_empty_domains()
+            elif kind == 'assign':
+                del self._own_assignments()[var]
+                if self._changed is not None: # neighbors' keys may drop
+                    self._changed.update(self.get_neighbors(var))
+            elif kind == 'rank':
+                if self._order_key is not None:
+                    self._own_order()
+                    self._order_rank[var] = entry[2]
+            elif kind == 'unassigned':
+                self._own_unassigned_vars().insert(entry[2], var)
+                self._touch(var) # back in the running for the ordering
+            elif kind == 'unassigned_order':
+                self._unassigned_vars = entry[2]
+                self._owns_unassigned = False
+                if self._order_key is not None:
+                    self._build_order_heap()
+        return self
+
+    # The constraint list is mirrored by an adjacency index so that lookups
+    # by variable cost O(degree) instead of a scan over every constraint.
+    # _outgoing[var] holds each constraint touching var oriented so that var
+    # comes first; _incoming[var] holds the same edges oriented so that var
+    # comes second.  Both lists follow the order of self.constraints.
+    # Reading .constraints returns a new list, so the index cannot go stale:
+    # add constraints with add_constraint(s), or assign a whole list.
+
+    @property
+    def constraints(self):
+        return self._constraints[:]
+
+    @constraints.setter
+    def constraints(self, constraint_list):
+        self._constraints = list(constraint_list)
+        self._owns_network = True
+        self._outgoing = {}
+        self._incoming = {}
+        self._neighbors = {}
+        self._supports = {}
+        for constraint in constraint_list:
+            self._index_constraint(constraint)
+
+    def _index_constraint(self, constraint):
+        "Adds a single constraint (and its reverse) to the adjacency index."
+        var1, var2 = constraint.var1, constraint.var2
+        self._outgoing.setdefault(var1, []).append(constraint)
+        self._incoming.setdefault(var2, []).append(constraint)
+        if var1 != var2:
+            reverse = constraint.reverse()
+            self._outgoing.setdefault(var2, []).append(reverse)
+            self._incoming.setdefault(var1, []).append(reverse)
+        self._neighbors.pop(var1, None)
+        self._neighbors.pop(var2, None)
+        self._supports.pop((var1, var2), None)
+        self._supports.pop((var2, var1), None)
+
+    # compile_supports() evaluates the constraints between each pair of
+    # neighbors once over the current domains.  _supports[(var, other)] is a
+    # pair (universe, table): universe is the frozenset of other's values
+    # at compile time, and table maps each value of var to the frozenset of
+    # other's values that support it: the values o for which every
+    # constraint from other to var accepts (o, value).
+    # Tables belong to the constraint network, so copies share them (a
+    # table compiled by any problem sharing the network is valid for all).
+
+    def compile_supports(self, var=None):
+        """Precomputes support tables for every pair of constrained variables
+        (or only the pairs involving var, if given) from their current
+        domains.  Pairs that already have a table are kept.  Domain values
+        must be hashable."""
+        for var1 in (self._outgoing if var is None else [var]):
+            for var2 in set([c.var2 for c in self._outgoing.get(var1, [])]):
+                if (var1, var2) not in self._supports:
+                    self._compile_pair(var1, var2)
+        return self
+
+    def _compile_pair(self, var, other):
+        constraints = self.constraints_between(var, other)
+        var_values = self.get_domain(var) if var in self.variables else []
+        other_values = self.get_domain(other) if other in self.variables else []
+        var_table = dict((val, set()) for val in var_values)
+        other_table = dict((val, set()) for val in other_values)
+        for val in var_values:
+            for other_val in other_values:
+                if all(c.check(val, other_val) for c in constraints):
+                    var_table[val].add(other_val)
+                    other_table[other_val].add(val)
+        self._supports[(other, var)] = (
+            frozenset(var_values),
+            dict((val, frozenset(sup)) for val, sup in other_table.items()))
+        if var != other:
+            self._supports[(var, other)] = (
+                frozenset(other_values),
+                dict((val, frozenset(sup)) for val, sup in var_table.items()))
+
+    # Global (n-ary) constraints are kept in their own list, indexed by each
+    # variable in their scope.  Like .constraints, reading .global_constraints
+    # returns a new list; use add_global_constraint or assign a whole list.
+
+    @property
+    def global_constraints(self):
+        return self._global_constraints[:]
+
+    @global_constraints.setter
+    def global_constraints(self, constraint_list):
+        self._global_constraints = list(constraint_list)
+        self._globals_of = {}
+        self._neighbors = {}
+        for constraint in constraint_list:
+            for var in constraint.variables:
+                self._globals_of.setdefault(var, []).append(constraint)
+
+    def add_global_constraint(self, constraint):
+        """Adds a global constraint (NaryConstraint, TableConstraint or
+        AllDifferent) over the variables in its scope."""
+        self._own_network()
+        self._global_constraints.append(constraint)
+        for var in constraint.variables:
+            self._globals_of.setdefault(var, []).append(constraint)
+            self._neighbors.pop(var, None)
+        return self
+
+    def get_global_constraints(self, var=None):
+        """Returns a list of the global constraints in the problem, or only
+        those whose scope includes var if it is provided."""
+        if var is None:
+            return self._global_constraints[:]
+        return self._globals_of.get(var, [])[:]
+
+    def get_supports(self, var, other):
+        """Returns the compiled support table for var against other as a pair
+        (universe, table), or None if supports have not been compiled."""
+        return self._supports.get((var, other))
+
     def get_domain(self, var) :
-        "Returns the list of values in the variable's domain."
+        """Returns a new list of the values in the variable's domain.  Changing
+        the list does not change the problem; use set_domain or eliminate."""
         if var not in self.variables :
             raise KeyError(str(var) + " is not a variable in this problem." + str(self.variables))
-        return self.domains.get(var, [])
+        return self._read_domain(var)
+
+    def _read_domain(self, var):
+        if self._compact:
+            mask = self._masks.get(var, 0)
+            values = self._values.get(var, ())
+            return [values[i] for i in range(mask.bit_length()) if mask >> i & 1]
+        return self._domains.get(var, [])[:]
 
     def set_domain(self, var, domain) :
         """Sets the domain of the variable to the specified list of values,
         sorted alphabetically/numerically."""
         if var not in self.variables :
             raise KeyError(str(var) + " is not a variable in this problem.")
-        self.domains[var] = sorted(domain[:])
+        return self._put_domain(var, sorted(domain[:]))
+
+    def _put_domain(self, var, values):
+        "Replaces var's domain with the given values, as they are ordered."
+        if self._compact:
+            self._record('intern', var, (self._values[var], self._positions[var],
+                                         self._masks[var])
+                         if var in self._masks else _MISSING)
+            self._intern(var, list(values))
+        else:
+            self._record('domain', var, self._domains.get(var, _MISSING))
+            self._domains[var] = list(values)
+            self._owned_domains.add(var)
+            self._note_domain(var)
+        self._touch(var)
+        return self
+
+    def _drop_domain(self, var):
+        "Removes var's domain entirely, as del csp.domains[var] does."
+        if self._compact:
+            self._record('intern', var, (self._values[var], self._positions[var],
+                                         self._masks[var]))
+            self._own_interning()
+            del self._values[var], self._positions[var], self._masks[var]
+        else:
+            self._record('domain', var, self._domains[var])
+            del self._domains[var]
+            self._owned_domains.discard(var)
+        self._empty.pop(var, None)
+        self._touch(var)
         return self
 
     def set_all_domains(self, domains_dict) :
@@ -62,7 +994,18 @@ class ConstraintSatisfactionProblem :
         if not set(domains_dict.keys()) <= set(self.variables):
             invalid_vars = [v for v in list(domains_dict.keys()) if v not in self.variables]
             raise KeyError(str(invalid_vars) + " are not variables in this problem.")
+        if self._compact:
+            self._record('interned', None, (self._values, self._positions,
+                                            self._masks))
+            self.domains = domains_dict
+            if self._changed is not None:
+                self._changed.update(domains_dict)
+            return self
+        self._record('domains', None, self._domains)
         self.domains = deepcopy(domains_dict)
+        self._owned_domains = set(self._domains)
+        if self._changed is not None:
+            self._changed.update(domains_dict)
         return self
 
     def get_all_variables(self):
@@ -71,23 +1014,50 @@ class ConstraintSatisfactionProblem :
 
     def get_all_constraints(self):
         "Returns a list of all the constraints in the problem."
-        return self.constraints[:]
+        return self._constraints[:]
 
     def eliminate(self, var, val) :
         """Removes the value from variable's domain.  Returns True if
         the domain contained the value when this function was
         called; False if the domain didn't contain the value."""
-        values = self.domains.get(var, [])
-        found = val in values
-        if found:
-            values.remove(val)
-        self.domains[var] = values
-        return found
+        if self._compact:
+            return self._eliminate_compact(var, val)
+        if var not in self._domains:
+            self._record('domain', var, _MISSING)
+            self._domains[var] = []
+            self._owned_domains.add(var)
+            self._empty.setdefault(var, None)
+        if val not in self._domains[var]:
+            return False
+        values = self._own_domain(var)
+        if self._trail is not None:
+            self._trail.append(('eliminate', var, values.index(val), val))
+        values.remove(val)
+        if not values:
+            self._empty.setdefault(var, None)
+        self._touch(var)
+        return True
+
+    def _eliminate_compact(self, var, val):
+        mask = self._masks.get(var)
+        if mask is None:
+            self._record('intern', var, _MISSING)
+            self._intern(var, [])
+            return False
+        position = self._positions[var].get(val)
+        if position is None or not mask >> position & 1:
+            return False
+        self._record('mask', var, mask)
+        self._masks[var] = mask & ~(1 << position)
+        if not self._masks[var]:
+            self._empty.setdefault(var, None)
+        self._touch(var)
+        return True
 
     def get_assignment(self, var) :
         """If the variable has been assigned a value, retrieve it. Returns None
         if the variable hasn't been assigned yet"""
-        return self.assignments.get(var, None)
+        return self._assignments.get(var, None)
 
     def set_assignment(self, var, val) :
         """Sets the assigned value of the variable to val, returning a modified
@@ -95,14 +1065,26 @@ class ConstraintSatisfactionProblem :
         not in the domain of the variable, or if var has already been assigned
         a value. For convenience, also modifies the variable's domain to contain
         only the assigned value."""
-        if self.assignments.get(var) is not None:
-            raise AttributeError("Can't assign variable " + str(var) + " to value " + str(val) + ": var has already been assigned value " + str(self.assignments.get(var)) +".")
+        if self._assignments.get(var) is not None:
+            raise AttributeError("Can't assign variable " + str(var) + " to value " + str(val) + ": var has already been assigned value " + str(self._assignments.get(var)) +".")
         elif val not in self.get_domain(var) :
             raise KeyError("The domain of " + str(var) + " does not contain the value " + str(val) + ".")
-        self.domains[var] = [val]
-        self.assignments[var] = val
-        if var in self.unassigned_vars:
-            self.unassigned_vars.remove(var)
+        trail = self._trail
+        if self._compact:
+            self._record('mask', var, self._masks[var])
+            self._masks[var] = 1 << self._positions[var][val]
+        else:
+            self._record('domain', var, self._domains.get(var, _MISSING))
+            self._domains[var] = [val]
+            self._owned_domains.add(var)
+        if trail is not None and var not in self._assignments:
+            trail.append(('assign', var))
+        self._own_assignments()[var] = val
+        if var in self._unassigned_vars:
+            unassigned_vars = self._own_unassigned_vars()
+            if trail is not None:
+                trail.append(('unassigned', var, unassigned_vars.index(var)))
+            unassigned_vars.remove(var)
         return self
 
     def set_assignments(self, var_val_pairs):
@@ -110,19 +1092,32 @@ class ConstraintSatisfactionProblem :
         return self
 
     def pop_next_unassigned_var(self):
-        """Returns first unassigned variable, or None if all variables are
+        """Returns first unassigned variable (or the best one under the order
+        given to set_variable_order), or None if all variables are
         assigned.  Modifies unassigned_vars list."""
-        return self.unassigned_vars.pop(0) if self.unassigned_vars else None
+        if not self._unassigned_vars:
+            return None
+        if self._order_key is not None:
+            return self._pop_ordered_var()
+        var = self._own_unassigned_vars().pop(0)
+        self._record('unassigned', var, 0)
+        return var
 
     def add_constraint(self, var1, var2, constraint_fn) :
         """Given two variables and a function to act as a constraint between
         them, creates a Constraint and adds it to the list of constraints"""
-        self.constraints.append(Constraint(var1, var2, constraint_fn))
+        constraint = Constraint(var1, var2, constraint_fn)
+        self._own_network()
+        self._constraints.append(constraint)
+        self._index_constraint(constraint)
         return self
 
     def add_constraints(self, constraint_list):
         "Adds all of the specified constraints to the problem"
-        self.constraints.extend(deepcopy(constraint_list))
+        self._own_network()
+        for constraint in deepcopy(constraint_list):
+            self._constraints.append(constraint)
+            self._index_constraint(constraint)
         return self
 
     def constraints_between(self, var1=None, var2=None) :
@@ -133,18 +1128,26 @@ class ConstraintSatisfactionProblem :
         # The returned constraints will be transformed so that var1
         # comes first and var2 comes second, as requested.
 
-        pred1 =  lambda node : (var1 is None) or (node == var1)
-        pred2 =  lambda node : (var2 is None) or (node == var2)
-
-        return [e for e in [e if pred1(e.var1) and pred2(e.var2) else
-             e.reverse() if pred2(e.var1) and pred1(e.var2)
-             else None
-             for e in self.constraints
-        ] if e is not None]
+        if var1 is None and var2 is None:
+            return self._constraints[:]
+        if var1 is None:
+            return self._incoming.get(var2, [])[:]
+        outgoing = self._outgoing.get(var1, [])
+        if var2 is None:
+            return outgoing[:]
+        return [c for c in outgoing if c.var2 == var2]
 
     def get_neighbors(self, var):
-        "Returns a list of variables that share constraints with var"
-        return sorted(set([c.var2 for c in self.constraints_between(var)]))
+        """Returns a list of variables that share constraints (binary or
+        global) with var"""
+        neighbors = self._neighbors.get(var)
+        if neighbors is None:
+            neighbors = set([c.var2 for c in self._outgoing.get(var, [])])
+            for constraint in self._globals_of.get(var, []):
+                neighbors.update(v for v in constraint.variables if v != var)
+            neighbors = sorted(neighbors)
+            self._neighbors[var] = neighbors
+        return neighbors[:]
 
     def set_unassigned_vars_order(self, unassigned_vars_ordered) :
         """Given an ordered list of unassigned variables, sets the list of
@@ -153,21 +1156,76 @@ class ConstraintSatisfactionProblem :
             and not (set(unassigned_vars_ordered) <= set(self.variables))) :
             raise AttributeError("unassigned_vars_ordered contains items that "
                                  +"are not variables in this problem")
-        if any([var in list(self.assignments.keys()) for var in unassigned_vars_ordered]):
+        if any([var in list(self._assignments.keys()) for var in unassigned_vars_ordered]):
             raise AttributeError("unassigned_vars_ordered contains variables "
                                  +"that are already assigned")
+        self._record('unassigned_order', None, self._unassigned_vars)
         self.unassigned_vars = unassigned_vars_ordered[:]
         return self
 
     def copy(self) :
-        "Return a (deep) copy of this problem."
-        return deepcopy(self)
+        """Return a copy of this problem.  The copy shares unchanged state
+        with the original.  Changing either problem through its methods or
+        through .domains, .assignments or .unassigned_vars never affects the
+        other, and get_domain and .constraints return new lists."""
+        new = self.__class__.__new__(self.__class__)
+        new.variables = self.variables
+        new._constraints = self._constraints
+        new._outgoing = self._outgoing
+        new._incoming = self._incoming
+        new._neighbors = self._neighbors
+        new._supports = self._supports
+        new._global_constraints = self._global_constraints
+        new._globals_of = self._globals_of
+        new._compact = self._compact
+        if self._compact:
+            new._domains = None
+            new._values = self._values
+            new._positions = self._positions
+            new._masks = dict(self._masks)
+            new._owns_interning = self._owns_interning = False
+        else:
+            new._domains = dict(self._domains)
+        new._empty = dict(self._empty)
+        new._assignments = self._assignments
+        new._unassigned_vars = self._unassigned_vars
+        new._owned_domains = set()
+        new._trail = None
+        new._weights = self._weights
+        new._weight_log = self._weight_log
+        new._order_key = self._order_key
+        new._changed = None
+        if self._order_key is not None:
+            new._order_rank = self._order_rank
+            new._order_heap = self._order_heap
+            new._changed = set(self._changed)
+            new._weight_seen = self._weight_seen
+            new._owns_order = self._owns_order = False
+        new._owns_network = new._owns_assignments = new._owns_unassigned = False
+        self._owned_domains = set()
+        self._owns_network = self._owns_assignments = self._owns_unassigned = False
+        return new
+
+    def __getstate__(self):
+        """Pickles the problem without its adjacency index and support
+        tables, which are derived from the constraints; unpickling rebuilds
+        the index."""
+        state = dict(self.__dict__)
+        for name in ('_outgoing', '_incoming', '_neighbors', '_supports'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.constraints = self._constraints
 
     def __str__(self):
         len_and_str = lambda x: tuple([fn(x) for fn in (len, str)])
         return ('ConstraintSatisfactionProblem with:'
                 + '\n * %i variables: %s' % len_and_str(self.variables)
                 + '\n * %i constraints: %s' % len_and_str(self.constraints)
+                + ('\n * %i global constraints: %s' % len_and_str(self.global_constraints)
+                   if self.global_constraints else '')
                 + '\n * %i domains: %s' % len_and_str(self.domains)
                 + '\n * %i unassigned vars: %s' % len_and_str(self.unassigned_vars)
                 + '\n * %i assigned values: %s' % len_and_str(self.assignments))
@@ -176,11 +1234,85 @@ class ConstraintSatisfactionProblem :
         return (isinstance_ConstraintSatisfactionProblem(other)
                 and self.variables == other.variables
                 and self.constraints == other.constraints
+                and self.global_constraints == other.global_constraints
                 and self.unassigned_vars == other.unassigned_vars
                 and self.domains == other.domains
                 and self.assignments == other.assignments)
 
 
+class PropagationQueue :
+    """The queue of variables waiting to be propagated.  Variables come out
+    in first-in, first-out order, and membership tests are O(1).  If a
+    priority function (csp, var) -> key is given, the variable with the
+    smallest key comes out first instead, in FIFO order among equal keys.
+    A key is computed when its variable is pushed; call update(var) when a
+    queued variable's domain changes so that it moves to its new place."""
+
+    def __init__(self, variables=(), priority=None, csp=None) :
+        self.priority = priority
+        self.csp = csp
+        self._fifo = deque()
+        self._heap = []
+        self._counter = 0
+        self._members = {} # var -> number of times it is in the FIFO queue
+        self._entries = {} # var -> counter of its live heap entry
+        for var in variables:
+            self.append(var)
+
+    def append(self, var) :
+        """Adds var to the back of the queue (or by priority; a variable is
+        queued at most once by priority, so appending it again only
+        updates its key)."""
+        if self.priority is None:
+            self._fifo.append(var)
+            self._members[var] = self._members.get(var, 0) + 1
+        else:
+            self._push(var)
+
+    def _push(self, var) :
+        # any older entry for var stays in the heap and is skipped by pop
+        heappush(self._heap, (self.priority(self.csp, var), self._counter, var))
+        self._entries[var] = self._counter
+        self._counter += 1
+
+    def update(self, var) :
+        "Recomputes the key of var if it is queued by priority."
+        if self.priority is not None and var in self._entries:
+            self._push(var)
+
+    def pop(self) :
+        "Removes and returns the next variable."
+        if self.priority is None:
+            var = self._fifo.popleft()
+            if self._members[var] == 1:
+                del self._members[var]
+            else:
+                self._members[var] -= 1
+            return var
+        while True:
+            key, counter, var = heappop(self._heap)
+            if self._entries.get(var) == counter:
+                del self._entries[var]
+                return var
+
+    def __contains__(self, var) :
+        return var in self._members or var in self._entries
+
+    def __len__(self) :
+        return len(self._fifo) + len(self._entries)
+
+    def __iter__(self) :
+        "Iterates over the queued variables in the order they will come out."
+        if self.priority is None:
+            return iter(list(self._fifo))
+        return iter([entry[2] for entry in sorted(self._heap)
+                     if self._entries.get(entry[2]) == entry[1]])
+
+    def __str__(self) :
+        return 'PropagationQueue(%s)' % list(self)
+    __repr__ = __str__
+
+
 def is_class_instance(obj, class_name):
     return hasattr(obj, '__class__') and obj.__class__.__name__ == class_name
 
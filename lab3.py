@@ -3,17 +3,19 @@
 
 from constraint_api import *
 from test_problems import get_pokemon_problem
+from time import perf_counter
+from collections import deque
+from queue import Empty, Queue
+import multiprocessing
+import os
+import random
 
 
 #### Part 1: Warmup ############################################################
 
 def has_empty_domains(csp) :
     """Returns True if the problem has one or more empty domains, otherwise False"""
-    domains = csp.domains # gets domains
-    for var in domains.keys(): # goes through variables
-        if domains[var] == []: # sees if domain list is empty
-            return True
-    return False
+    return csp.has_empty_domain() # tracked incrementally by the problem
 
 def check_all_constraints(csp) :
     """Return False if the problem's assigned values violate some constraint,
@@ -23,52 +25,119 @@ def check_all_constraints(csp) :
     Iterates through them and checks each of their constraints
     Check based on the value 
     Only perform checks if other variable was assigned
+    Each constraint is checked once: from whichever of its two variables
+    comes second
     """
 
     assignments = csp.assignments # gets assigned variables-value dict
-    assigned_vars = assignments.keys() # get the assigned variables
-    for var in assigned_vars: # iterates per assigned variables
+    checked_vars = set() # assigned variables whose constraints were checked
+    for var in assignments: # iterates per assigned variables
         constraints = csp.constraints_between(var, None) # gets constraints related to variable
         for constraint in constraints: # iterates through those constraints
             var2 = constraint.var2 # gets other variable 
-            if var2 in assigned_vars: # check if other variable is assigned
+            if var2 in checked_vars or var2 == var: # other variable assigned and not yet checked against var
                 val1 = assignments[var] # gets val1 and val2
                 val2 = assignments[var2]
                 if not constraint.check(val1, val2): # checks for validity
                     return False
+        checked_vars.add(var)
+    for constraint in csp.get_global_constraints(): # n-ary constraints
+        if not constraint.check(assignments):
+            return False
+    return True
+
+def check_new_assignment(csp, var) :
+    """Return False if var's assigned value violates a constraint with
+    another assigned variable (or a global constraint on var), otherwise
+    True.  Only the constraints touching var are checked, so this equals
+    check_all_constraints when the other assignments were already
+    consistent, e.g. right after var is assigned at a search node whose
+    parent passed the full check."""
+    assignments = csp.assignments
+    value = assignments[var]
+    for constraint in csp.constraints_between(var, None):
+        var2 = constraint.var2
+        if var2 in assignments and not constraint.check(value, assignments[var2]):
+            return False
+    for constraint in csp.get_global_constraints(var):
+        if not constraint.check(assignments):
+            return False
     return True
 
 
 
 #### Part 2: Depth-First Constraint Solver #####################################
 
-def solve_constraint_dfs(problem) :
+def _children(csp, var, values, prepare=None) :
+    """Lazily yields csp's children: one copy per value, with var assigned to
+    that value and, if prepare is given, prepare(child, var) applied.  Each
+    child is only built when the search pops it."""
+    for value in values:
+        child = csp.copy()
+        child.set_assignment(var, value)
+        if prepare != None:
+            prepare(child, var)
+        yield child
+
+def _depth_first(problem, prepare=None, value_order=None, agenda=None,
+                 budget=None) :
     """
-    Solves the problem using depth-first search.  Returns a tuple containing:
-    1. the solution (a dictionary mapping variables to assigned values)
-    2. the number of extensions made (the number of problems popped off the agenda).
-    If no solution was found, return None as the first element of the tuple.
+    Lazily searches problem depth-first, yielding (solution, extensions) for
+    each solution as it is found, then (None, extensions) once the search is
+    exhausted.  The agenda is a stack of child generators (see _children), so
+    an expansion costs O(1) and siblings are copied and prepared only when
+    reached.  Extensions are counted exactly as in solve_constraint_dfs.
+    If budget is given, the search also ends after that many extensions; to
+    resume it elsewhere, pass an empty list as agenda and collect the nodes
+    left on it with _unexplored.
     """
-    queue = [problem]
+    if agenda == None:
+        agenda = []
+    stack = agenda # (variable the nodes just assigned, node iterator) pairs
+    stack.append((None, iter([problem])))
     extensions = 0
-    while queue:
-        curr = queue.pop(0)
+    while stack and (budget == None or extensions < budget):
+        assigned, nodes = stack[-1]
+        curr = next(nodes, None)
+        if curr == None:
+            stack.pop()
+            continue
         extensions += 1
         if not has_empty_domains(curr):
-            if check_all_constraints(curr):
+            # the parent passed, so only the new assignment needs checking
+            if assigned == None:
+                consistent = check_all_constraints(curr)
+            else:
+                consistent = check_new_assignment(curr, assigned)
+            if consistent:
                 if curr.unassigned_vars:
                     var = curr.pop_next_unassigned_var()
-                    domains = curr.get_domain(var)
-                    new_problems = []
-                    for value in domains:
-                        new_problem = curr.copy()
-                        new_problem.set_assignment(var, value)
-                        new_problems.append(new_problem)
-                    queue = new_problems + queue
+                    if value_order != None:
+                        values = value_order(curr, var)
+                    else:
+                        values = curr.get_domain(var)[:]
+                    stack.append((var, _children(curr, var, values, prepare)))
                 else:
-                    return (curr.assignments, extensions)
+                    yield (curr.assignments, extensions)
 
-    return (None, extensions)
+    yield (None, extensions)
+
+def _unexplored(agenda) :
+    """Empties the agenda of a stopped _depth_first search, returning the
+    nodes it had yet to visit in the order it would have visited them."""
+    nodes = []
+    while agenda:
+        nodes.extend(agenda.pop()[1])
+    return nodes
+
+def solve_constraint_dfs(problem) :
+    """
+    Solves the problem using depth-first search.  Returns a tuple containing:
+    1. the solution (a dictionary mapping variables to assigned values)
+    2. the number of extensions made (the number of problems popped off the agenda).
+    If no solution was found, return None as the first element of the tuple.
+    """
+    return next(_depth_first(problem))
 
 
 # QUESTION 1: How many extensions does it take to solve the Pokemon problem
@@ -83,46 +152,120 @@ ANSWER_1 = 20
 
 #### Part 3: Forward Checking ##################################################
 
-def eliminate_from_neighbors(csp, var) :
+def eliminate_from_neighbors(csp, var, engine=None) :
     """
     Eliminates incompatible values from var's neighbors' domains, modifying
     the original csp.  Returns an alphabetically sorted list of the neighboring
     variables whose domains were reduced, with each variable appearing at most
     once.  If no domains were reduced, returns empty list.
     If a domain is reduced to size 0, quits immediately and returns None.
+    If an arc-consistency engine (e.g. AC3rm()) is given, it finds the
+    incompatible values instead of find_unsupported_values.
     """
-    # see which of if w and v of W and V are incompatible
-    def compare_val(V, W, v, w, csp=csp):
-        constraints = csp.constraints_between(V, W)
-        for constraint in constraints:
-            if not constraint.check(v, w):
-                return False
-        return True
-
+    if engine == None:
+        unsupported_values = find_unsupported_values
+    else:
+        unsupported_values = engine.find_unsupported_values
     reduced = []
     changed_vars = set()
     V_domain = csp.get_domain(var)
     neighbors = csp.get_neighbors(var) # get all neighbors
     for W in neighbors:
-        W_domain = csp.get_domain(W)
-        for w in W_domain:
-            at_least_one = False
-            for v in V_domain:
-                if compare_val(var, W, v, w):
-                    at_least_one = True
-            if not at_least_one:
-                reduced.append((W,w)) # add removed states and value
-                changed_vars.add(W)
-
-    for (var, val) in reduced:
-        csp.eliminate(var, val)
+        for w in unsupported_values(csp, var, W, V_domain):
+            reduced.append((W,w)) # add removed states and value
+            changed_vars.add(W)
+
+    for (W, w) in reduced:
+        csp.eliminate(W, w)
         
-    for var in changed_vars:
-        if not csp.get_domain(var):
+    for W in sorted(changed_vars): # blame the same variable on every run
+        if not csp.get_domain(W):
+            csp.increment_weight((var, W)) # for weighted-degree ordering
+            return None
+
+    # global constraints filter their whole scope (e.g. AllDifferent matching)
+    for constraint in csp.get_global_constraints(var):
+        filtered = constraint.filter(csp)
+        if filtered == None:
+            csp.increment_weight(constraint.variables)
             return None
+        changed_vars.update(filtered)
 
     return sorted(list(changed_vars))
 
+def find_unsupported_values(csp, var, W, V_domain=None) :
+    """Returns the values in W's domain that are incompatible with every value
+    in var's domain (V_domain, if given), in domain order.  Uses the support
+    tables from csp.compile_supports() when they cover the domains involved,
+    and checks the constraints between var and W otherwise."""
+    if V_domain is None:
+        V_domain = csp.get_domain(var)
+    W_domain = csp.get_domain(W)
+    constraints = csp.constraints_between(var, W)
+    if not constraints: # W only shares global constraints with var
+        return []
+    unsupported = _native_unsupported_values(constraints, V_domain, W_domain)
+    if unsupported is not None:
+        return unsupported
+    supports = csp.get_supports(W, var)
+    if supports is not None:
+        universe, table = supports
+        V_values = set(V_domain)
+        if V_values <= universe:
+            unsupported = []
+            for w in W_domain:
+                w_supports = table.get(w)
+                if w_supports is None:
+                    if not _has_support(constraints, V_domain, w):
+                        unsupported.append(w)
+                elif w_supports.isdisjoint(V_values):
+                    unsupported.append(w)
+            return unsupported
+    return [w for w in W_domain if not _has_support(constraints, V_domain, w)]
+
+# Built-in symmetric constraints that find_unsupported_values revises
+# directly by comparing domains instead of calling the function per pair
+_NATIVE_KINDS = {constraint_equal: 'equal', constraint_different: 'different'}
+
+def _native_unsupported_values(constraints, V_domain, W_domain) :
+    """Revises W_domain against V_domain by comparing the domains, if every
+    constraint is a built-in one.  Returns the unsupported values, or None
+    if the constraints have to be checked value by value."""
+    kind = _native_kind(constraints)
+    if kind is None:
+        return None
+    try:
+        V_values = set(V_domain)
+    except TypeError: # unhashable values: fall back to generic checks
+        return None
+    if kind == 'equal':
+        return [w for w in W_domain if w not in V_values]
+    elif kind == 'different':
+        if len(V_values) > 1:
+            return []
+        return [w for w in W_domain if not V_values or w in V_values]
+    return W_domain[:] # contradiction
+
+def _native_kind(constraints) :
+    """Returns 'equal' or 'different' if every constraint is that built-in,
+    'contradiction' if both appear, or None if some constraint is arbitrary."""
+    kinds = set()
+    for constraint in constraints:
+        kind = _NATIVE_KINDS.get(constraint.base_fn())
+        if kind is None:
+            return None
+        kinds.add(kind)
+    if len(kinds) == 2:
+        return 'contradiction'
+    return kinds.pop() if kinds else None
+
+def _has_support(constraints, V_domain, w) :
+    "Returns True if some v in V_domain satisfies every constraint with w."
+    for v in V_domain:
+        if all(constraint.check(v, w) for constraint in constraints):
+            return True
+    return False
+
 
 # Because names give us power over things (you're free to use this alias)
 forward_check = eliminate_from_neighbors
@@ -132,27 +275,7 @@ def solve_constraint_forward_checking(problem) :
     Solves the problem using depth-first search with forward checking.
     Same return type as solve_constraint_dfs.
     """
-    queue = [problem]
-    extensions = 0
-    while queue:
-        curr = queue.pop(0)
-        extensions += 1
-        if not has_empty_domains(curr):
-            if check_all_constraints(curr):
-                if curr.unassigned_vars:
-                    var = curr.pop_next_unassigned_var()
-                    domains = curr.get_domain(var)
-                    new_problems = []
-                    for value in domains:
-                        new_problem = curr.copy()
-                        new_problem.set_assignment(var, value)
-                        forward_check(new_problem, var)
-                        new_problems.append(new_problem)
-                    queue = new_problems + queue
-                else:
-                    return (curr.assignments, extensions)
-
-    return (None, extensions)
+    return next(_depth_first(problem, forward_check))
 
 
 # QUESTION 2: How many extensions does it take to solve the Pokemon problem
@@ -174,13 +297,16 @@ def domain_reduction(csp, queue=None) :
     were removed from the queue.  Variables may appear in the list multiple times.
     If a domain is reduced to size 0, quits immediately and returns None.
     This function modifies the original csp.
+    queue may also be a PropagationQueue (for example, one with a priority).
     """
     dequeue = []
     # Only set queue if queue is None, not if empty
     if queue == None: 
         queue = csp.get_all_variables()
+    if not isinstance(queue, PropagationQueue): # O(1) pops and membership
+        queue = PropagationQueue(queue)
     while queue:
-        var = queue.pop(0)
+        var = queue.pop()
         dequeue.append(var)
         fc = forward_check(csp, var)
         if fc == None:
@@ -188,6 +314,8 @@ def domain_reduction(csp, queue=None) :
         for i in fc:
             if i not in queue:
                 queue.append(i)
+            else:
+                queue.update(i) # a priority key may have dropped
 
     return dequeue
 
@@ -202,33 +330,17 @@ print(solve_constraint_dfs(q3))
 ANSWER_3 = 6
 
 
+def _reduce_from(csp, var) :
+    "Propagates domain reductions outward from var, which was just assigned."
+    domain_reduction(csp, [var])
+
 def solve_constraint_propagate_reduced_domains(problem) :
     """
     Solves the problem using depth-first search with forward checking and
     propagation through all reduced domains.  Same return type as
     solve_constraint_dfs.
     """
-    queue = [problem]
-    extensions = 0
-    while queue:
-        curr = queue.pop(0)
-        extensions += 1
-        if not has_empty_domains(curr):
-            if check_all_constraints(curr):
-                if curr.unassigned_vars:
-                    var = curr.pop_next_unassigned_var()
-                    domains = curr.get_domain(var)
-                    new_problems = []
-                    for value in domains:
-                        new_problem = curr.copy()
-                        new_problem.set_assignment(var, value)
-                        domain_reduction(new_problem, [var])
-                        new_problems.append(new_problem)
-                    queue = new_problems + queue
-                else:
-                    return (curr.assignments, extensions)
-
-    return (None, extensions)
+    return next(_depth_first(problem, _reduce_from))
 
 
 
@@ -241,25 +353,39 @@ ANSWER_4 = 7
 
 #### Part 5A: Generic Domain Reduction #########################################
 
-def propagate(enqueue_condition_fn, csp, queue=None) :
+def propagate(enqueue_condition_fn, csp, queue=None, engine=None, priority=None) :
     """
     Uses constraints to reduce domains, modifying the original csp.
     Uses enqueue_condition_fn to determine whether to enqueue a variable whose
     domain has been reduced. Same return type as domain_reduction.
+    engine optionally selects the arc-consistency algorithm used to revise
+    neighbors (an instance or class such as AC3, AC3rm or AC4); all engines
+    reduce the same values, at different constraint-check costs.
+    queue may also be a PropagationQueue (for example, one with a priority).
+    If priority (a key function such as CostScheduler()) is given, variables
+    are dequeued smallest key first instead of first-in, first-out.
     """
+    if isinstance(engine, type):
+        engine = engine()
+    if engine != None:
+        engine.start(csp)
     dequeue = []
     if queue == None: 
         queue = csp.get_all_variables()
+    if not isinstance(queue, PropagationQueue): # O(1) pops and membership
+        queue = PropagationQueue(queue, priority, csp)
     while queue:
-        var = queue.pop(0)
+        var = queue.pop()
         dequeue.append(var)
-        fc = forward_check(csp, var)
+        fc = forward_check(csp, var, engine)
         if fc == None:
             return None
         for i in fc:
             if i not in queue:
                 if enqueue_condition_fn(csp, i):
                     queue.append(i)
+            else:
+                queue.update(i) # a priority key may have dropped
 
     return dequeue
 
@@ -279,37 +405,1089 @@ def condition_forward_checking(csp, var) :
     return False
 
 
+# Arc-consistency engines for propagate.  Each revises the arc from a
+# dequeued variable to one neighbor and counts the constraint checks (value
+# pairs passed to constraint functions) and arc revisions it performed.
+# Built-in constraint_equal/constraint_different arcs are revised by
+# comparing domains and cost no checks.  Domain values must be hashable.
+
+_NO_SUPPORT = object()
+
+class AC3 :
+    """AC-3: looks for a support of every neighbor value from scratch on each
+    revision.  Ignores compiled support tables, as a baseline."""
+
+    def __init__(self) :
+        self.checks = 0
+        self.revisions = 0
+
+    def start(self, csp) :
+        "Called by propagate before the first revision."
+        pass
+
+    def find_unsupported_values(self, csp, var, W, V_domain) :
+        """Returns the values in W's domain with no support in V_domain,
+        like find_unsupported_values."""
+        constraints = csp.constraints_between(var, W)
+        if not constraints:
+            return []
+        self.revisions += 1
+        W_domain = csp.get_domain(W)
+        unsupported = _native_unsupported_values(constraints, V_domain, W_domain)
+        if unsupported is not None:
+            return unsupported
+        return self.revise(var, W, constraints, V_domain, W_domain)
+
+    def revise(self, var, W, constraints, V_domain, W_domain) :
+        return [w for w in W_domain
+                if self.find_support(constraints, V_domain, w) is _NO_SUPPORT]
+
+    def find_support(self, constraints, V_domain, w) :
+        "Returns the first v in V_domain compatible with w, or _NO_SUPPORT."
+        for v in V_domain:
+            self.checks += 1
+            if all(constraint.check(v, w) for constraint in constraints):
+                return v
+        return _NO_SUPPORT
+
+class AC3rm(AC3) :
+    """AC-3 with multi-directional residual supports (AC-3rm, the
+    search-friendly form of AC-2001): remembers the last support found for
+    each value and only searches again once that support is gone.  Residues
+    stay valid across nodes, so reuse one instance for a whole search (but
+    only for one problem)."""
+
+    def __init__(self) :
+        AC3.__init__(self)
+        self.residues = {} # (var, W, w) -> value of var supporting w
+
+    def revise(self, var, W, constraints, V_domain, W_domain) :
+        residues = self.residues
+        V_values = set(V_domain)
+        unsupported = []
+        for w in W_domain:
+            residue = residues.get((var, W, w), _NO_SUPPORT)
+            if residue is not _NO_SUPPORT and residue in V_values:
+                continue
+            v = self.find_support(constraints, V_domain, w)
+            if v is _NO_SUPPORT:
+                unsupported.append(w)
+            else:
+                residues[(var, W, w)] = v
+                residues[(W, var, v)] = w
+        return unsupported
+
+class AC4(AC3) :
+    """AC-4: counts the supports of every value once per arc, then keeps the
+    counters up to date as values disappear from the dequeued variable, so
+    a value is removed exactly when its counter reaches zero.  Counters are
+    rebuilt at the start of each propagate call."""
+
+    def start(self, csp) :
+        self.arcs = {}
+
+    def revise(self, var, W, constraints, V_domain, W_domain) :
+        arc = self.arcs.get((var, W))
+        V_values = set(V_domain)
+        if arc is None or not V_values <= arc[2]:
+            counts = dict((w, 0) for w in W_domain)
+            supported = dict((v, []) for v in V_domain)
+            for w in W_domain:
+                for v in V_domain:
+                    self.checks += 1
+                    if all(constraint.check(v, w) for constraint in constraints):
+                        counts[w] += 1
+                        supported[v].append(w)
+            self.arcs[(var, W)] = (counts, supported, set(V_domain))
+        else:
+            counts, supported, seen = arc
+            for v in seen - V_values:
+                for w in supported[v]:
+                    counts[w] -= 1
+            seen.intersection_update(V_values)
+        unsupported = []
+        for w in W_domain:
+            if w not in counts: # value added since the counters were built
+                if self.find_support(constraints, V_domain, w) is _NO_SUPPORT:
+                    unsupported.append(w)
+            elif counts[w] == 0:
+                unsupported.append(w)
+        return unsupported
+
+
+# Priority scheduling for propagate
+
+class CostScheduler :
+    """Priority key for propagate (and PropagationQueue) that handles cheap,
+    high-yield revisions first: singleton domains before all others, then
+    the variable whose neighbor revisions are estimated cheapest.  Arcs
+    carrying only built-in constraints cost about |D1| + |D2|; other arcs
+    cost |D1| * |D2| checks, each weighted by the cost of its constraint
+    function in fn_costs (relative to constraint_different; functions not
+    listed cost 1).  Keys depend only on the domains and fn_costs, so
+    propagation is reproducible; measure_costs fills fn_costs by timing the
+    functions once, after which the costs stay fixed."""
+
+    SAMPLE_SIZE = 20
+
+    def __init__(self, fn_costs=None) :
+        # constraint function -> relative cost per check
+        self.fn_costs = dict(fn_costs or {})
+
+    def __call__(self, csp, var) :
+        size = csp.domain_size(var)
+        cost = 0.0
+        for W in csp.get_neighbors(var):
+            constraints = csp.constraints_between(var, W)
+            if not constraints:
+                continue
+            W_size = csp.domain_size(W)
+            if _native_kind(constraints) is not None:
+                cost += size + W_size
+            else:
+                cost += size * W_size * sum(self.fn_cost(c) for c in constraints)
+        return (size != 1, cost)
+
+    def fn_cost(self, constraint) :
+        "Returns the relative cost of one check of constraint."
+        return self.fn_costs.get(constraint.base_fn(), 1)
+
+    def measure_costs(self, csp) :
+        """Times each constraint function of csp not yet in fn_costs on a
+        small sample of value pairs, relative to constraint_different, and
+        stores the results in fn_costs.  Returns fn_costs."""
+        for constraint in csp.get_all_constraints():
+            fn = constraint.base_fn()
+            if fn in self.fn_costs:
+                continue
+            pairs = [(v, w) for v in csp.get_domain(constraint.var1)
+                     for w in csp.get_domain(constraint.var2)][:self.SAMPLE_SIZE]
+            self.fn_costs[fn] = (_time_checks(constraint.check, pairs)
+                                 / max(_time_checks(constraint_different, pairs), 1e-9))
+        return self.fn_costs
+
+def _time_checks(check, pairs) :
+    "Returns the seconds taken to call check on every pair of values."
+    start = perf_counter()
+    for v, w in pairs:
+        check(v, w)
+    return perf_counter() - start
+
+def propagation_savings(enqueue_condition_fn, csp, queue=None, priority=None,
+                        engine=AC3) :
+    """Propagates copies of csp twice, first-in first-out and with the
+    priority key (a CostScheduler by default), each with its own instance
+    of engine.  Does not modify csp.  Returns a dictionary with the
+    'revisions' and 'checks' of each run (under 'fifo' and 'priority') and
+    how many of each the priority schedule saved."""
+    if priority == None:
+        priority = CostScheduler()
+    runs = {}
+    for name, key in (('fifo', None), ('priority', priority)):
+        counter = engine()
+        propagate(enqueue_condition_fn, csp.copy(),
+                  None if queue == None else list(queue), counter, key)
+        runs[name] = {'revisions': counter.revisions, 'checks': counter.checks}
+    runs['revisions_saved'] = runs['fifo']['revisions'] - runs['priority']['revisions']
+    runs['checks_saved'] = runs['fifo']['checks'] - runs['priority']['checks']
+    return runs
+
+
 #### Part 5B: Generic Constraint Solver ########################################
 
-def solve_constraint_generic(problem, enqueue_condition=None) :
+def solve_constraint_generic(problem, enqueue_condition=None, variable_order=None,
+                             value_order=None) :
     """
     Solves the problem, calling propagate with the specified enqueue
     condition (a function). If enqueue_condition is None, uses DFS only.
+    If variable_order (a key function, e.g. order_mrv) is given, expands
+    the unassigned variable with the smallest key instead of the first one.
+    If value_order (e.g. order_lcv) is given, it returns the values of the
+    expanded variable in the order their children should be tried.
+    Same return type as solve_constraint_dfs.
+    """
+    return next(_generic_search(problem, enqueue_condition, variable_order,
+                                value_order))
+
+def _generic_search(problem, enqueue_condition=None, variable_order=None,
+                    value_order=None) :
+    """Sets up the depth-first search behind solve_constraint_generic and
+    iter_solutions; see _depth_first for what it yields."""
+    problem = problem.copy().fork_weights()
+    if variable_order != None:
+        problem.set_variable_order(variable_order)
+    return _depth_first(problem, _propagator(enqueue_condition), value_order)
+
+def _propagator(enqueue_condition) :
+    """Returns the function that prepares each child after var is assigned:
+    propagation with enqueue_condition, or None (DFS only) if it is None."""
+    if enqueue_condition == None:
+        return None
+    return lambda csp, var: propagate(enqueue_condition, csp, [var])
+
+def iter_solutions(problem, enqueue_condition=None, variable_order=None,
+                   value_order=None, limit=None) :
+    """
+    Generator over every solution of the problem, searched exactly as in
+    solve_constraint_generic (same arguments).  Yields a tuple containing:
+    1. the solution (a dictionary mapping variables to assigned values)
+    2. the number of extensions made so far, counting from the start of
+       the search.
+    Solutions are found lazily, one per next(), and only the current search
+    path is kept in memory.  If limit is given, stops after that many
+    solutions.
+    """
+    found = 0
+    if limit != None and limit <= 0:
+        return
+    for solution, extensions in _generic_search(problem, enqueue_condition,
+                                                variable_order, value_order):
+        if solution == None:
+            return
+        yield (solution, extensions)
+        found += 1
+        if limit != None and found >= limit:
+            return
+
+def count_solutions(problem, enqueue_condition=None) :
+    """
+    Returns the number of solutions of the problem, i.e. the number of
+    solutions iter_solutions would yield, without enumerating them.
+    Each search node forward checks (or, if enqueue_condition is given,
+    propagates with it), so unassigned variables are only coupled through
+    the constraint graph among themselves.  The unassigned variables are
+    split into connected components (via get_neighbors), which are counted
+    independently and multiplied, re-splitting after every assignment.
+    Component counts are memoized on the component's residual domains (and
+    the assigned values of variables sharing a global constraint with it),
+    so repeated subproblems are counted once.
+    Does not modify the original problem.
+    """
+    csp = problem.copy().fork_weights()
+    if has_empty_domains(csp) or not check_all_constraints(csp):
+        return 0
+    prepare = _propagator(enqueue_condition) or forward_check
+    for var in list(csp.assignments):
+        if prepare(csp, var) == None:
+            return 0
+    rank = dict((var, i) for i, var in enumerate(csp.unassigned_vars))
+    calls = [_count_split(csp, list(csp.unassigned_vars), rank, prepare, {})]
+    count = None
+    while True: # runs the counting coroutines on an explicit stack
+        try:
+            call = calls[-1].send(count)
+        except StopIteration as done:
+            calls.pop()
+            count = done.value
+            if not calls:
+                return count
+            continue
+        calls.append(call)
+        count = None
+
+def _components(csp, variables) :
+    """Splits variables into the connected components of the constraint
+    graph restricted to them, each listed in the order of variables."""
+    rank = dict((var, i) for i, var in enumerate(variables))
+    seen = set()
+    components = []
+    for var in variables:
+        if var in seen:
+            continue
+        seen.add(var)
+        component = []
+        frontier = [var]
+        while frontier:
+            V = frontier.pop()
+            component.append(V)
+            for W in csp.get_neighbors(V):
+                if W in rank and W not in seen:
+                    seen.add(W)
+                    frontier.append(W)
+        components.append(sorted(component, key=rank.get))
+    return components
+
+def _count_split(csp, variables, rank, prepare, memo) :
+    """Counting coroutine: yields one _count_component call per connected
+    component of variables and returns the product of their counts."""
+    count = 1
+    for component in _components(csp, variables):
+        count *= yield _count_component(csp, component, rank, prepare, memo)
+        if not count:
+            return 0
+    return count
+
+def _count_component(csp, component, rank, prepare, memo) :
+    """Counting coroutine for one connected component: branches on its
+    smallest domain and returns the summed counts of the children."""
+    assignments = csp.assignments
+    linked = set()
+    for var in component:
+        for constraint in csp.get_global_constraints(var):
+            linked.update((W, assignments[W]) for W in constraint.variables
+                          if W in assignments)
+    key = (frozenset((var, frozenset(csp.get_domain(var))) for var in component),
+           frozenset(linked))
+    if key in memo:
+        return memo[key]
+    var = min(component, key=lambda V: (csp.domain_size(V), rank[V]))
+    rest = [V for V in component if V != var]
+    count = 0
+    for value in csp.get_domain(var)[:]:
+        child = csp.copy()
+        child.set_assignment(var, value)
+        if prepare(child, var) == None or has_empty_domains(child):
+            continue
+        count += yield _count_split(child, rest, rank, prepare, memo)
+    memo[key] = count
+    return count
+
+def solve_constraint_decomposed(problem, enqueue_condition=None,
+                                variable_order=None, value_order=None,
+                                processes=None) :
+    """
+    Solves the problem like solve_constraint_generic (same arguments), but
+    first partitions the unassigned variables into the connected components
+    of the constraint graph and searches each component separately, so a
+    failure in one component never re-explores the others.  The number of
+    extensions is the sum over the component searches.
+    If processes (a number of worker processes) is given, the components
+    are solved in parallel on a process pool, which is terminated (stopping
+    any searches still running) as soon as one component has no solution;
+    the problem, its constraint functions and the enqueue condition must
+    then be picklable.
+    Does not modify the original problem.
     Same return type as solve_constraint_dfs.
     """
-    queue = [problem]
+    if has_empty_domains(problem) or not check_all_constraints(problem):
+        return (None, 1)
+    components = _components(problem, problem.unassigned_vars)
+    if not components:
+        return (dict(problem.assignments), 1)
+    # hand each constraint to the component it involves; constraints among
+    # assigned variables only were checked above
+    component_of = {}
+    for i, component in enumerate(components):
+        for var in component:
+            component_of[var] = i
+    constraints = [[] for component in components]
+    global_constraints = [[] for component in components]
+    for constraint in problem.constraints:
+        i = component_of.get(constraint.var1, component_of.get(constraint.var2))
+        if i != None:
+            constraints[i].append(constraint)
+    for constraint in problem.global_constraints:
+        for var in constraint.variables:
+            if var in component_of:
+                global_constraints[component_of[var]].append(constraint)
+                break
+    subproblems = [_subproblem(problem, components[i], constraints[i],
+                               global_constraints[i])
+                   for i in range(len(components))]
+    args = (enqueue_condition, variable_order, value_order)
+    solution = dict(problem.assignments)
     extensions = 0
-    while queue:
-        curr = queue.pop(0)
-        extensions += 1
-        if not has_empty_domains(curr):
-            if check_all_constraints(curr):
-                if curr.unassigned_vars:
-                    var = curr.pop_next_unassigned_var()
-                    domains = curr.get_domain(var)
-                    new_problems = []
-                    for value in domains:
-                        new_problem = curr.copy()
-                        new_problem.set_assignment(var, value)
-                        if enqueue_condition != None:
-                            propagate(enqueue_condition, new_problem, [var])
-                        new_problems.append(new_problem)
-                    queue = new_problems + queue
-                else:
-                    return (curr.assignments, extensions)
+    if processes == None or len(subproblems) == 1:
+        for subproblem in subproblems:
+            sub_solution, sub_extensions = solve_constraint_generic(subproblem, *args)
+            extensions += sub_extensions
+            if sub_solution == None:
+                return (None, extensions)
+            solution.update(sub_solution)
+        return (solution, extensions)
+    jobs = [(subproblem,) + args for subproblem in subproblems]
+    # leaving the with block terminates the pool, running searches included
+    with multiprocessing.Pool(processes) as pool:
+        for sub_solution, sub_extensions in pool.imap_unordered(_solve_job, jobs):
+            extensions += sub_extensions
+            if sub_solution == None:
+                return (None, extensions)
+            solution.update(sub_solution)
+    return (solution, extensions)
+
+def _solve_job(job) :
+    "Worker for solve_constraint_decomposed: solve_constraint_generic(*job)."
+    return solve_constraint_generic(*job)
+
+def _subproblem(csp, component, constraints, global_constraints) :
+    """Returns a new problem over the variables of component (a connected
+    component of csp's unassigned variables) and the assigned variables
+    sharing one of the given constraints with it, keeping their domains and
+    assignments.  Only the component is left unassigned."""
+    linked = set(component)
+    for constraint in constraints:
+        linked.update([constraint.var1, constraint.var2])
+    for constraint in global_constraints:
+        linked.update(constraint.variables)
+    variables = [var for var in csp.get_all_variables() if var in linked]
+    subproblem = ConstraintSatisfactionProblem(variables)
+    subproblem.set_all_domains(dict((var, csp.get_domain(var))
+                                    for var in variables))
+    subproblem.add_constraints(constraints)
+    for constraint in global_constraints:
+        subproblem.add_global_constraint(constraint)
+    assignments = csp.assignments
+    subproblem.set_assignments([(var, assignments[var]) for var in variables
+                                if var in assignments])
+    return subproblem.set_unassigned_vars_order(component)
+
+def solve_constraint_parallel(problem, enqueue_condition=None,
+                              variable_order=None, value_order=None,
+                              processes=None, budget=1000) :
+    """
+    Solves the problem like solve_constraint_generic (same first four
+    arguments), searching on a pool of worker processes (processes of them;
+    by default one per CPU).  The top of the search tree is expanded here
+    until there are four work units (subtrees) per worker.  Each unit is
+    searched for at most budget extensions; a unit that runs out of budget
+    sends back the nodes it has not explored, which are queued as new units
+    for whichever workers are idle, so large subtrees are shared out.
+    Returns the first solution any worker finds, terminating the workers so
+    that no unit is still being searched after the call.  extensions is the
+    total over all processes; it and the solution found may vary from run
+    to run.  The problem, its constraint functions and the enqueue
+    condition and orderings must be picklable.
+    Does not modify the original problem.
+    Same return type as solve_constraint_dfs.
+    """
+    problem = problem.copy().fork_weights()
+    if variable_order != None:
+        problem.set_variable_order(variable_order)
+    prepare = _propagator(enqueue_condition)
+    workers = processes or os.cpu_count() or 1
+    units = [problem]
+    extensions = 0
+    while units and len(units) < 4 * workers:
+        agenda = []
+        solution, expanded = next(_depth_first(units.pop(0), prepare,
+                                               value_order, agenda, 1))
+        extensions += expanded
+        if solution != None:
+            return (solution, extensions)
+        units = _unexplored(agenda) + units
+    args = (enqueue_condition, value_order, budget)
+    results = Queue()
+    # leaving the with block terminates the pool, running units included
+    with multiprocessing.Pool(workers) as pool:
+        for unit in units:
+            pool.apply_async(_search_unit, (unit,) + args, callback=results.put,
+                             error_callback=results.put)
+        pending = len(units)
+        while pending:
+            result = results.get()
+            pending -= 1
+            if isinstance(result, Exception):
+                raise result
+            solution, expanded, unexplored = result
+            extensions += expanded
+            if solution != None:
+                return (solution, extensions)
+            for unit in unexplored:
+                pool.apply_async(_search_unit, (unit,) + args,
+                                 callback=results.put, error_callback=results.put)
+            pending += len(unexplored)
+    return (None, extensions)
 
+def _search_unit(problem, enqueue_condition, value_order, budget) :
+    """Worker for solve_constraint_parallel: searches one unit for at most
+    budget extensions.  Returns (solution or None, extensions, unexplored
+    nodes)."""
+    agenda = []
+    search = _depth_first(problem, _propagator(enqueue_condition), value_order,
+                          agenda, budget)
+    solution, extensions = next(search)
+    if solution != None:
+        return (solution, extensions, [])
+    return (None, extensions, _unexplored(agenda))
+
+def solve_constraint_tree(problem) :
+    """
+    Solves the problem in linear time when its binary constraint graph
+    (over the unassigned variables) is a forest: makes each tree
+    directionally arc consistent from the leaves up, then assigns it from
+    the root down without backtracking.  Otherwise conditions on a cycle
+    cutset (see cycle_cutset): searches the cutset's assignments with
+    forward checking and solves the remaining forest the same way for each.
+    Extensions are the cutset search's extensions plus one per variable
+    assigned in a forest pass.  Does not modify the original problem.
+    Same return type as solve_constraint_dfs.
+    """
+    csp = problem.copy().fork_weights()
+    if has_empty_domains(csp) or not check_all_constraints(csp):
+        return (None, 1)
+    for var in list(csp.assignments):
+        if forward_check(csp, var) == None:
+            return (None, 1)
+    cutset = cycle_cutset(csp)
+    forest = [var for var in csp.unassigned_vars if var not in cutset]
+    order = _forest_order(csp, forest)
+    conditioned = csp.copy().set_unassigned_vars_order(cutset)
+    extensions = 0
+    for assignment, extensions in _depth_first(conditioned, forward_check):
+        if assignment == None:
+            break
+        child = csp.copy()
+        for var in cutset:
+            child.set_assignment(var, assignment[var])
+            forward_check(child, var)
+        solution, assigned = _solve_forest(child, order)
+        extensions += assigned
+        if solution != None:
+            return (solution, extensions)
     return (None, extensions)
 
+def cycle_cutset(csp) :
+    """Returns a small list of unassigned variables whose removal leaves the
+    binary constraint graph over the remaining unassigned variables a
+    forest.  Variables in a global constraint's scope or with a constraint
+    on themselves are always included.  Greedy: repeatedly strips the
+    variables with at most one remaining neighbor, then moves the
+    remaining variable with the most neighbors into the cutset."""
+    unassigned = csp.unassigned_vars
+    cutset = set(var for constraint in csp.get_global_constraints()
+                 for var in constraint.variables if var in unassigned)
+    graph = {}
+    for var in unassigned:
+        neighbors = set(c.var2 for c in csp.constraints_between(var))
+        if var in neighbors:
+            cutset.add(var)
+        graph[var] = neighbors
+    remaining = dict((var, set(W for W in graph[var]
+                               if W in graph and W not in cutset and W != var))
+                     for var in graph if var not in cutset)
+    while True:
+        leaves = [var for var in remaining if len(remaining[var]) <= 1]
+        while leaves:
+            var = leaves.pop()
+            if var not in remaining:
+                continue
+            for W in remaining.pop(var):
+                remaining[W].discard(var)
+                if len(remaining[W]) <= 1:
+                    leaves.append(W)
+        if not remaining:
+            return [var for var in unassigned if var in cutset]
+        var = max(remaining, key=lambda V: len(remaining[V]))
+        cutset.add(var)
+        for W in remaining.pop(var):
+            remaining[W].discard(var)
+
+def _forest_order(csp, variables) :
+    """Lists (var, parent) pairs for the forest formed by the binary
+    constraints among variables, each tree in breadth-first order from its
+    first variable; roots have parent None."""
+    members = set(variables)
+    order = []
+    seen = set()
+    for root in variables:
+        if root in seen:
+            continue
+        seen.add(root)
+        order.append((root, None))
+        frontier = deque([root])
+        while frontier:
+            V = frontier.popleft()
+            for W in sorted(set(c.var2 for c in csp.constraints_between(V))):
+                if W in members and W not in seen:
+                    seen.add(W)
+                    order.append((W, V))
+                    frontier.append(W)
+    return order
+
+def _solve_forest(csp, order) :
+    """Solves the forest given by order (see _forest_order) in place,
+    assuming its variables' domains are already consistent with every
+    assigned variable.  Returns a tuple of the solution (or None) and the
+    number of variables assigned."""
+    for var, parent in reversed(order): # directional arc consistency
+        if parent != None:
+            for value in find_unsupported_values(csp, var, parent):
+                csp.eliminate(parent, value)
+        if not csp.get_domain(parent if parent != None else var):
+            return (None, 0)
+    for var, parent in order:
+        values = csp.get_domain(var)
+        if parent != None:
+            constraints = csp.constraints_between(parent, var)
+            parent_value = [csp.assignments[parent]]
+            values = [value for value in values
+                      if _has_support(constraints, parent_value, value)]
+        csp.set_assignment(var, values[0])
+    return (csp.assignments, len(order))
+
+# Variable orderings for solve_constraint_generic.  Each takes (csp, var) and
+# returns a key; the unassigned variable with the smallest key is expanded
+# next.  A key may only decrease when var's domain shrinks or one of its
+# constraint weights grows (see ConstraintSatisfactionProblem.set_variable_order).
+
+def order_mrv(csp, var) :
+    "Minimum remaining values: prefer the variable with the smallest domain."
+    return csp.domain_size(var)
+
+def order_mrv_degree(csp, var) :
+    """Minimum remaining values, breaking ties in favor of the variable
+    constrained with the most unassigned variables."""
+    assignments = csp.assignments
+    degree = len([W for W in csp.get_neighbors(var) if W not in assignments])
+    return (csp.domain_size(var), -degree)
+
+def order_dom_wdeg(csp, var) :
+    """Weighted degree (dom/wdeg): prefer a small domain relative to the
+    summed weights of var's constraints that still involve an unassigned
+    variable.  Weights grow each time a constraint wipes out a domain."""
+    assignments = csp.assignments
+    wdeg = 0
+    for W in set([c.var2 for c in csp.constraints_between(var)]):
+        if W not in assignments:
+            wdeg += csp.get_weight((var, W))
+    for constraint in csp.get_global_constraints(var):
+        if any(W not in assignments and W != var for W in constraint.variables):
+            wdeg += csp.get_weight(constraint.variables)
+    if not wdeg:
+        return float('inf')
+    return csp.domain_size(var) / float(wdeg)
+
+def order_lcv(csp, var) :
+    """Least constraining value: returns var's domain sorted by how many
+    values each one would eliminate from the domains of var's unassigned
+    neighbors (fewest first, ties in domain order).  Scores come from the
+    problem's support tables.  If a table is missing, every pair is compiled
+    at once from the current domains: the first call of a search is at its
+    root, so the tables cover every branch, and the forward checks that
+    follow reuse them instead of calling the constraint functions again.
+    Only binary constraints are scored."""
+    values = csp.get_domain(var)
+    assignments = csp.assignments
+    neighbors = [W for W in set([c.var2 for c in csp.constraints_between(var)])
+                 if W not in assignments]
+    scores = dict((value, 0) for value in values)
+    for W in neighbors:
+        W_domain = csp.get_domain(W)
+        if csp.get_supports(var, W) is None:
+            csp.compile_supports()
+        universe, table = csp.get_supports(var, W)
+        W_values = set(W_domain)
+        covered = W_values <= universe
+        constraints = csp.constraints_between(var, W)
+        for value in values:
+            if covered and value in table:
+                compatible = len(W_values & table[value])
+            else:
+                compatible = len([w for w in W_domain
+                                  if _has_support(constraints, [value], w)])
+            scores[value] += len(W_domain) - compatible
+    return sorted(values, key=lambda value: scores[value])
+
+# Configurations raced by solve_constraint_portfolio.  Each is a dict of
+# solve_constraint_generic keyword arguments, plus an optional 'seed' that
+# shuffles the order of the unassigned variables first.
+PORTFOLIO = [{'enqueue_condition': None},
+             {'enqueue_condition': condition_forward_checking},
+             {'enqueue_condition': condition_singleton},
+             {'enqueue_condition': condition_domain_reduction},
+             {'enqueue_condition': condition_forward_checking,
+              'variable_order': order_mrv_degree},
+             {'enqueue_condition': condition_forward_checking,
+              'variable_order': order_dom_wdeg, 'seed': 1}]
+
+def solve_constraint_portfolio(problem, configurations=None, timeout=None) :
+    """
+    Races several configurations of solve_constraint_generic (by default
+    PORTFOLIO), each in its own process, and returns the first answer.
+    Returns a tuple containing:
+    1. the solution (None if the problem has no solution)
+    2. the number of extensions the winning configuration made
+    3. the winning configuration (one of configurations)
+    The other processes are terminated as soon as one answers.  If timeout
+    (in seconds) passes before any answers, returns (None, 0, None).
+    If every configuration raises an exception, re-raises the first one.
+    Does not modify the original problem.
+    """
+    if configurations == None:
+        configurations = PORTFOLIO
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_run_configuration,
+                                         args=(problem, configuration, i, results))
+                 for i, configuration in enumerate(configurations)]
+    for process in processes:
+        process.start()
+    deadline = None
+    if timeout != None:
+        deadline = perf_counter() + timeout
+    errors = []
+    try:
+        while len(errors) < len(processes):
+            remaining = None
+            if deadline != None:
+                remaining = max(0, deadline - perf_counter())
+            try:
+                i, answer = results.get(timeout=remaining)
+            except Empty:
+                return (None, 0, None)
+            if isinstance(answer, Exception):
+                errors.append(answer)
+                continue
+            solution, extensions = answer
+            return (solution, extensions, configurations[i])
+        raise errors[0]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+def _run_configuration(problem, configuration, i, results) :
+    """Portfolio worker: solves the problem with one configuration and puts
+    (i, (solution, extensions)) or (i, exception) on the results queue."""
+    try:
+        options = dict(configuration)
+        seed = options.pop('seed', None)
+        if seed != None:
+            problem = problem.copy()
+            variables = problem.unassigned_vars[:]
+            random.Random(seed).shuffle(variables)
+            problem.set_unassigned_vars_order(variables)
+        results.put((i, solve_constraint_generic(problem, **options)))
+    except Exception as error:
+        results.put((i, error))
+
+# Restart schedules for solve_constraint_restarts.  Each maps the number of
+# the run (1, 2, 3, ...) to its extension cutoff in units.
+
+def luby(i) :
+    "The Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ..."
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if i == (1 << k) - 1:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+def geometric(i, ratio=1.5) :
+    "Cutoffs growing by a constant ratio: 1, 1.5, 2.25, ..."
+    return ratio ** (i - 1)
+
+def solve_constraint_restarts(problem, enqueue_condition=None,
+                              variable_order=order_dom_wdeg, schedule=luby,
+                              unit=32, seed=None) :
+    """
+    Solves the problem by repeated randomized runs of the
+    solve_constraint_generic search, each cut off after
+    unit * schedule(run) extensions (schedule is luby or geometric).
+    Each run breaks variable-ordering ties randomly (by shuffling the
+    unassigned variables) and tries values in random order.  The runs share
+    one set of constraint weights, so what dom/wdeg learns from one run's
+    failures carries over to the next.  A run that exhausts its search tree
+    within the cutoff proves there is no solution.
+    seed makes the runs, and so the solution and extensions returned,
+    reproducible.  extensions is the total over all runs.  Does not modify the original problem.
+    Same return type as solve_constraint_dfs.
+    """
+    problem = problem.copy().fork_weights()
+    rng = random.Random(seed)
+    prepare = _propagator(enqueue_condition)
+    def shuffled_values(csp, var):
+        values = csp.get_domain(var)[:]
+        rng.shuffle(values)
+        return values
+    extensions = 0
+    run = 0
+    while True:
+        run += 1
+        csp = problem.copy()
+        variables = csp.unassigned_vars[:]
+        rng.shuffle(variables)
+        csp.set_unassigned_vars_order(variables)
+        if variable_order != None:
+            csp.set_variable_order(variable_order)
+        agenda = []
+        cutoff = max(1, int(unit * schedule(run)))
+        solution, expanded = next(_depth_first(csp, prepare, shuffled_values,
+                                               agenda, cutoff))
+        extensions += expanded
+        if solution != None or not agenda:
+            return (solution, extensions)
+
+def solve_min_conflicts(problem, max_steps=100000, time_limit=None,
+                        tabu_tenure=10, walk_probability=0.02, seed=None) :
+    """
+    Local search for large problems.  Gives every unassigned variable a value
+    (greedily, fewest conflicts with the variables valued so far), then
+    repeatedly picks a variable in a violated constraint at random and moves
+    it to the value that violates the fewest constraints.  A variable may not
+    return to a value it left within the last tabu_tenure steps, unless that
+    would beat the best assignment so far; with probability
+    walk_probability the new value is picked at random instead.
+    Conflict counts are kept per variable and updated incrementally from the
+    constraints of the moved variable only.  Stops when no constraint is
+    violated, after max_steps steps or after time_limit seconds.
+    Returns a tuple containing:
+    1. the best complete assignment found (a solution if 3. is 0)
+    2. the number of steps taken
+    3. the number of constraints that assignment violates
+    Assigned variables keep their values.  If an unassigned variable has an
+    empty domain, returns (None, 0, None).  seed makes the search
+    reproducible.  Does not modify the original problem.
+    """
+    rng = random.Random(seed)
+    deadline = None
+    if time_limit != None:
+        deadline = perf_counter() + time_limit
+    domains = problem.domains
+    variables = problem.unassigned_vars[:]
+    if any(not domains.get(var) for var in variables):
+        return (None, 0, None)
+    values = dict(problem.assignments)
+    outgoing = dict((var, problem.constraints_between(var)) for var in variables)
+    global_constraints = dict((var, problem.get_global_constraints(var))
+                              for var in variables)
+
+    def score(var, value) :
+        "Number of constraints var would violate with the value."
+        violated = 0
+        for constraint in outgoing[var]:
+            W = constraint.var2
+            if W == var:
+                violated += not constraint.check(value, value)
+            elif W in values:
+                violated += not constraint.check(value, values[W])
+        if global_constraints[var]:
+            valued = var in values
+            old = values.get(var)
+            values[var] = value
+            violated += len([g for g in global_constraints[var]
+                             if not g.check(values)])
+            if valued:
+                values[var] = old
+            else:
+                del values[var]
+        return violated
+
+    for var in variables: # greedy start
+        scores = [(score(var, value), rng.random(), value)
+                  for value in domains[var]]
+        values[var] = min(scores)[2]
+
+    # conflicts[var] counts the violated constraints on each movable variable;
+    # conflicted lists the movable variables with any, position[var] its index
+    movable = set(variables)
+    conflicts = dict((var, 0) for var in variables)
+    conflicted = []
+    position = {}
+    def update(var, delta) :
+        if var not in movable:
+            return
+        conflicts[var] += delta
+        if conflicts[var] and var not in position:
+            position[var] = len(conflicted)
+            conflicted.append(var)
+        elif not conflicts[var] and var in position:
+            last = conflicted.pop()
+            i = position.pop(var)
+            if last != var:
+                conflicted[i] = last
+                position[last] = i
+
+    total = 0
+    for constraint in problem.constraints:
+        V, W = constraint.var1, constraint.var2
+        if not constraint.check(values[V], values[W]):
+            total += 1
+            update(V, 1)
+            if W != V:
+                update(W, 1)
+    for constraint in problem.get_global_constraints():
+        if not constraint.check(values):
+            total += 1
+            for V in constraint.variables:
+                update(V, 1)
+
+    best, best_total = dict(values), total
+    steps = 0
+    tabu = {} # (var, value) -> step until which var may not take value
+    while (total and conflicted and steps < max_steps
+           and (deadline == None or perf_counter() < deadline)):
+        steps += 1
+        var = conflicted[rng.randrange(len(conflicted))]
+        old = values[var]
+        if rng.random() < walk_probability:
+            value = rng.choice(domains[var])
+        else:
+            current = score(var, old)
+            candidates = []
+            for value in domains[var]:
+                s = score(var, value)
+                if (tabu.get((var, value), 0) >= steps
+                    and total - current + s >= best_total):
+                    continue
+                candidates.append((s, rng.random(), value))
+            if not candidates:
+                continue
+            value = min(candidates)[2]
+        if value == old:
+            continue
+        tabu[(var, old)] = steps + tabu_tenure
+        old_globals = [not g.check(values) for g in global_constraints[var]]
+        for constraint in outgoing[var]:
+            W = constraint.var2
+            if W == var:
+                delta = ((not constraint.check(value, value))
+                         - (not constraint.check(old, old)))
+            else:
+                delta = ((not constraint.check(value, values[W]))
+                         - (not constraint.check(old, values[W])))
+                update(W, delta)
+            total += delta
+            update(var, delta)
+        values[var] = value
+        for g, was_violated in zip(global_constraints[var], old_globals):
+            delta = (not g.check(values)) - was_violated
+            if delta:
+                total += delta
+                for V in g.variables:
+                    update(V, delta)
+        if total < best_total:
+            best, best_total = dict(values), total
+    return (best, steps, best_total)
+
+def solve_constraint_trail(problem, enqueue_condition=None) :
+    """
+    Solves the problem like solve_constraint_generic, but searches a single
+    copy of the problem in place instead of queueing a copy per child.
+    Every change is recorded on the problem's trail and undone on
+    backtracking, so memory grows with search depth only.  Makes the same
+    number of extensions as solve_constraint_generic.
+    Same return type as solve_constraint_dfs.
+    """
+    csp = problem.copy().fork_weights().start_trail()
+    extensions = 0
+    stack = [] # one [var, values, next value index, checkpoint] per depth
+    visit = True
+    assigned = None # variable assigned at the node being visited
+    while True:
+        if visit:
+            extensions += 1
+            if assigned == None:
+                consistent = check_all_constraints(csp)
+            else:
+                consistent = check_new_assignment(csp, assigned)
+            if not has_empty_domains(csp) and consistent:
+                if not csp.unassigned_vars:
+                    return (dict(csp.assignments), extensions)
+                var = csp.pop_next_unassigned_var()
+                stack.append([var, csp.get_domain(var)[:], 0, csp.checkpoint()])
+        if not stack:
+            return (None, extensions)
+        frame = stack[-1]
+        var, values, i, mark = frame
+        csp.undo_to(mark)
+        if i == len(values):
+            stack.pop()
+            visit = False
+            continue
+        frame[2] = i + 1
+        csp.set_assignment(var, values[i])
+        assigned = var
+        if enqueue_condition != None:
+            propagate(enqueue_condition, csp, [var])
+        visit = True
+
+def solve_constraint_backjumping(problem, variable_order=None) :
+    """
+    Solves the problem by forward checking with conflict-directed
+    backjumping (FC-CBJ) and nogood recording, searching a single trailed
+    copy of the problem like solve_constraint_trail.
+    Each search variable keeps the set of earlier variables that pruned its
+    domain.  When a value fails (a forward check empties a domain, or the
+    value completes a recorded nogood), the culprits are added to the
+    conflict set of the variable being assigned.  When its values run out,
+    that conflict set is recorded as a nogood and the search jumps straight
+    back to the most recently assigned variable in it, skipping the
+    variables in between.  Nogoods are indexed by (variable, value), so each
+    assignment only checks the nogoods it could complete.
+    Pruning done by a global constraint is blamed on every search variable
+    in its scope and on their culprits.  variable_order is as in
+    solve_constraint_generic.  Does not modify the original problem.
+    Same return type as solve_constraint_dfs.
+    """
+    csp = problem.copy().fork_weights()
+    if variable_order != None:
+        csp.set_variable_order(variable_order)
+    if has_empty_domains(csp) or not check_all_constraints(csp):
+        return (None, 1)
+    for var in list(csp.assignments):
+        if forward_check(csp, var) == None:
+            return (None, 1)
+    csp.start_trail()
+    extensions = 1
+    culprits = {} # var -> search variables whose assignments pruned its domain
+    nogoods = {} # (var, value) -> nogoods (frozensets of (var, value)) using it
+    level = {} # search variable -> depth
+    stack = [] # one [var, values, next value index, checkpoint, conflict set,
+               #      culprits saved before the current value] per depth
+    descend = True
+    while True:
+        if descend:
+            if not csp.unassigned_vars:
+                return (dict(csp.assignments), extensions)
+            var = csp.pop_next_unassigned_var()
+            level[var] = len(stack)
+            stack.append([var, csp.get_domain(var)[:], 0, csp.checkpoint(),
+                          set(), {}])
+            descend = False
+        var, values, i, mark, conflicts, saved = stack[-1]
+        csp.undo_to(mark)
+        culprits.update(saved)
+        saved.clear()
+        if i == len(values):
+            conflicts = (conflicts | culprits.get(var, set())) - set([var])
+            if not conflicts:
+                return (None, extensions)
+            assignments = csp.assignments
+            nogood = frozenset((V, assignments[V]) for V in conflicts)
+            for literal in nogood:
+                nogoods.setdefault(literal, []).append(nogood)
+            culprit = max(conflicts, key=level.get)
+            while stack[-1][0] != culprit:
+                frame = stack.pop()
+                del level[frame[0]]
+                culprits.update(frame[5])
+            stack[-1][4].update(conflicts - set([culprit]))
+            continue
+        value = values[i]
+        stack[-1][2] = i + 1
+        extensions += 1
+        assignments = csp.assignments
+        violated = None
+        for nogood in nogoods.get((var, value), []):
+            if all(V == var or assignments.get(V) == w for V, w in nogood):
+                violated = nogood
+                break
+        if violated != None:
+            conflicts.update(V for V, w in violated if V != var)
+            continue
+        scope = set()
+        for constraint in csp.get_global_constraints(var):
+            scope.update(constraint.variables)
+        blame = set([var])
+        for V in scope:
+            if V in level:
+                blame.add(V)
+            blame.update(culprits.get(V, ()))
+        csp.set_assignment(var, value)
+        reduced = forward_check(csp, var)
+        if reduced == None:
+            wiped = csp.first_wiped_out_var()
+            if wiped in scope:
+                conflicts.update(blame)
+            conflicts.update(culprits.get(wiped, ()))
+            conflicts.discard(var)
+            continue
+        for W in reduced:
+            saved.setdefault(W, culprits.get(W, set()))
+            culprits[W] = culprits.get(W, set()) | (blame if W in scope
+                                                    else set([var]))
+        descend = True
+
 # QUESTION 5: How many extensions does it take to solve the Pokemon problem
 #    with forward checking and propagation through singleton domains? (Don't
 #    use domain reduction before solving it.)
@@ -333,7 +1511,8 @@ def constraint_not_adjacent(m, n) :
 
 def all_different(variables) :
     """Returns a list of constraints, with one difference constraint between
-    each pair of variables."""
+    each pair of variables.  (For large sets of variables, a single
+    AllDifferent global constraint is smaller and prunes more.)"""
     constraints = []
     for i in range(len(variables)):
         for j in range(i+1, len(variables)):
@@ -148,3 +148,14 @@ domains_B_nope = {'A':[1,2,3], 'B':[1,3], 'C':[1,2,3]}
 CSP_B_nope = CSP(list('ABC')).set_all_domains(domains_B_nope) \
     .add_constraints([cons_AB_equal]).set_assignment('A',2)
 CSP_B_nope_after_eliminate = CSP_B_nope.copy().set_domain('B',[])
+
+# Global AllDifferent constraint: C must take the value left over by A and B
+CSP_all_different = CSP(list('ABC')) \
+    .set_all_domains({'A':[1,2], 'B':[1,2], 'C':[1,2,3]}) \
+    .add_global_constraint(AllDifferent(list('ABC')))
+CSP_all_different_reduced = CSP_all_different.copy().set_domain('C',[3])
+
+# Table constraint over A, B, C: allowed tuples list the solutions directly
+table_ABC = TableConstraint(list('ABC'), [(1,2,3), (2,3,1), (3,1,2)])
+CSP_table = CSP_ABC.copy().add_global_constraint(table_ABC)
+CSP_table_inconsistent = CSP_table.copy().set_assignments([('A',1), ('B',3)])
@@ -121,7 +121,7 @@ def decode_constraint(var1, var2, constraint_fn_name):
 
 def encode_CSP(csp):
     return [csp.variables, list(map(encode_constraint, csp.constraints)),
-            csp.unassigned_vars, csp.domains, csp.assignments]
+            csp.unassigned_vars, dict(csp.domains), csp.assignments]
 def decode_CSP(variables, constraint_list, unassigned_vars, domains, assignments):
     csp = ConstraintSatisfactionProblem(variables)
     csp.constraints = [decode_constraint(*c_args) for c_args in constraint_list]
@@ -1,6 +1,6 @@
 # MIT 6.034 Lab 3: Constraint Satisfaction Problems
 
-from tester import make_test, get_tests
+from tester import make_test, get_tests, get_lab_module
 from test_problems import *
 from random import randint, random
 lab_number = 3
@@ -1146,3 +1146,533 @@ make_test(type = 'VALUE',
           expected_val = ('(correct number of extensions for Pokemon problem, '
                           +'solved with DFS+FC+PROP-1)'),
           name = ANSWER_5_getargs)
+
+
+#### Tests for solver extensions ###############################################
+
+## solve_constraint_trail
+#pokemon problem, singleton propagation -> same as solve_constraint_generic  #TEST 85
+solve_constraint_trail_0_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 8)
+def solve_constraint_trail_0_getargs() :
+    return [get_pokemon_problem(), lambda p,v: len(p.get_domain(v))==1]
+def solve_constraint_trail_0_testanswer(val, original_val = None) :
+    return val == solve_constraint_trail_0_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_trail_0_getargs,
+          testanswer = solve_constraint_trail_0_testanswer,
+          expected_val = str(solve_constraint_trail_0_expected),
+          name = 'solve_constraint_trail')
+
+#no soln, DFS only -> same extensions as solve_constraint_generic  #TEST 86
+solve_constraint_trail_1_expected = (None, 13)
+def solve_constraint_trail_1_getargs() :
+    return [CSP_impossible.copy(), None]
+def solve_constraint_trail_1_testanswer(val, original_val = None) :
+    return val == solve_constraint_trail_1_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_trail_1_getargs,
+          testanswer = solve_constraint_trail_1_testanswer,
+          expected_val = str(solve_constraint_trail_1_expected),
+          name = 'solve_constraint_trail')
+
+## AllDifferent (global constraint)
+#queue=None, matching removes A and B's values from C -> [A, B, C]  #TEST 87
+domain_reduction_all_different_input_csp = CSP_all_different.copy()
+def domain_reduction_all_different_getargs() :
+    return [domain_reduction_all_different_input_csp]
+def domain_reduction_all_different_testanswer(val, original_val = None) :
+    return (val == list('ABC')
+            and domain_reduction_all_different_input_csp == CSP_all_different_reduced)
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = domain_reduction_all_different_getargs,
+          testanswer = domain_reduction_all_different_testanswer,
+          expected_val = "['A', 'B', 'C'] (with C's domain reduced to [3])",
+          name = 'domain_reduction')
+
+#DFS+FC with a global AllDifferent  #TEST 88
+solve_constraint_generic_all_different_expected = ({'A':1, 'B':2, 'C':3}, 4)
+def solve_constraint_generic_all_different_getargs() :
+    return [CSP_all_different.copy(), lambda p,v: False]
+def solve_constraint_generic_all_different_testanswer(val, original_val = None) :
+    return val == solve_constraint_generic_all_different_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_generic_all_different_getargs,
+          testanswer = solve_constraint_generic_all_different_testanswer,
+          expected_val = str(solve_constraint_generic_all_different_expected),
+          name = 'solve_constraint_generic')
+
+## TableConstraint (global constraint)
+#partial assignment agreeing with no allowed tuple -> False  #TEST 89
+def check_all_constraints_table_getargs() :
+    return [CSP_table_inconsistent.copy()]
+def check_all_constraints_table_testanswer(val, original_val = None) :
+    return val == False
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = check_all_constraints_table_getargs,
+          testanswer = check_all_constraints_table_testanswer,
+          expected_val = "False",
+          name = 'check_all_constraints')
+
+#DFS+FC+PROP-ANY only visits tuples in the table  #TEST 90
+solve_constraint_generic_table_expected = ({'A':1, 'B':2, 'C':3}, 4)
+def solve_constraint_generic_table_getargs() :
+    return [CSP_table.copy(), lambda p,v: True]
+def solve_constraint_generic_table_testanswer(val, original_val = None) :
+    return val == solve_constraint_generic_table_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_generic_table_getargs,
+          testanswer = solve_constraint_generic_table_testanswer,
+          expected_val = str(solve_constraint_generic_table_expected),
+          name = 'solve_constraint_generic')
+
+## variable ordering
+#pokemon problem, DFS+FC with minimum remaining values  #TEST 91
+solve_constraint_generic_mrv_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 8)
+def solve_constraint_generic_mrv_getargs() :
+    return [get_pokemon_problem(), lambda p,v: False, lambda p,v: p.domain_size(v)]
+def solve_constraint_generic_mrv_testanswer(val, original_val = None) :
+    return val == solve_constraint_generic_mrv_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_generic_mrv_getargs,
+          testanswer = solve_constraint_generic_mrv_testanswer,
+          expected_val = str(solve_constraint_generic_mrv_expected),
+          name = 'solve_constraint_generic')
+
+## propagate with an arc-consistency engine
+#same dequeue list and domains as the default revision  #TEST 92
+propagate_engine_input_csp = triangle_problem_modified.copy()
+propagate_engine_expected = list('BACAB')
+def propagate_engine_getargs() :
+    lab = get_lab_module()
+    return [lambda p,v: True, propagate_engine_input_csp, ['B','A'], lab.AC3rm]
+def propagate_engine_testanswer(val, original_val = None) :
+    return (val == propagate_engine_expected
+            and propagate_engine_input_csp == triangle_problem_modified_reduced)
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = propagate_engine_getargs,
+          testanswer = propagate_engine_testanswer,
+          expected_val = (str(propagate_engine_expected)
+                          + " (with domains modified in original csp)"),
+          name = 'propagate')
+
+## enumerating solutions
+#every tuple of the table, lazily, with running extension counts  #TEST 93
+iter_solutions_table_expected = [({'A':1, 'B':2, 'C':3}, 7),
+                                 ({'A':2, 'B':3, 'C':1}, 13)]
+def iter_solutions_table_getargs() :
+    return [CSP_table.copy(), None, None, None, 2]
+def iter_solutions_table_testanswer(val, original_val = None) :
+    return list(val) == iter_solutions_table_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = iter_solutions_table_getargs,
+          testanswer = iter_solutions_table_testanswer,
+          expected_val = str(iter_solutions_table_expected),
+          name = 'iter_solutions')
+
+## counting solutions
+#AllDifferent keeps its scope in one component  #TEST 94
+count_solutions_all_different_expected = 2
+def count_solutions_all_different_getargs() :
+    return [CSP_all_different.copy()]
+def count_solutions_all_different_testanswer(val, original_val = None) :
+    return val == count_solutions_all_different_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = count_solutions_all_different_getargs,
+          testanswer = count_solutions_all_different_testanswer,
+          expected_val = str(count_solutions_all_different_expected),
+          name = 'count_solutions')
+
+## decomposition
+#unconstrained variables are searched as separate components  #TEST 95
+solve_constraint_decomposed_expected = ({'A':1, 'B':1, 'C':1}, 6)
+def solve_constraint_decomposed_getargs() :
+    return [CSP_no_constraints.copy()]
+def solve_constraint_decomposed_testanswer(val, original_val = None) :
+    return val == solve_constraint_decomposed_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_decomposed_getargs,
+          testanswer = solve_constraint_decomposed_testanswer,
+          expected_val = str(solve_constraint_decomposed_expected),
+          name = 'solve_constraint_decomposed')
+
+## tree-structured problems
+#pokemon problem, conditioned on the cycle cutset ['Q1']  #TEST 96
+solve_constraint_tree_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 7)
+def solve_constraint_tree_getargs() :
+    return [get_pokemon_problem()]
+def solve_constraint_tree_testanswer(val, original_val = None) :
+    return val == solve_constraint_tree_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_tree_getargs,
+          testanswer = solve_constraint_tree_testanswer,
+          expected_val = str(solve_constraint_tree_expected),
+          name = 'solve_constraint_tree')
+
+## parallel search
+#pokemon problem has a single solution, whichever worker finds it  #TEST 97
+solve_constraint_parallel_expected = {'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}
+def solve_constraint_parallel_getargs() :
+    lab = get_lab_module()
+    return [get_pokemon_problem(), lab.condition_forward_checking, None, None, 2, 3]
+def solve_constraint_parallel_testanswer(val, original_val = None) :
+    return val[0] == solve_constraint_parallel_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_parallel_getargs,
+          testanswer = solve_constraint_parallel_testanswer,
+          expected_val = ("(" + str(solve_constraint_parallel_expected)
+                          + ", <extensions>)"),
+          name = 'solve_constraint_parallel')
+
+## portfolio
+#a one-configuration portfolio answers like solve_constraint_generic  #TEST 98
+solve_constraint_portfolio_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 8)
+def solve_constraint_portfolio_getargs() :
+    lab = get_lab_module()
+    return [get_pokemon_problem(), [{'enqueue_condition': lab.condition_singleton}]]
+def solve_constraint_portfolio_testanswer(val, original_val = None) :
+    return (val[:2] == solve_constraint_portfolio_expected
+            and val[2]['enqueue_condition'].__name__ == 'condition_singleton')
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_portfolio_getargs,
+          testanswer = solve_constraint_portfolio_testanswer,
+          expected_val = ("(" + str(solve_constraint_portfolio_expected)[1:-1]
+                          + ", {'enqueue_condition': condition_singleton})"),
+          name = 'solve_constraint_portfolio')
+
+## conflict-directed backjumping
+#CSP_impossible: every value of A wipes out B, leaving no culprit  #TEST 99
+solve_constraint_backjumping_expected = (None, 4)
+def solve_constraint_backjumping_getargs() :
+    return [CSP_impossible.copy()]
+def solve_constraint_backjumping_testanswer(val, original_val = None) :
+    return val == solve_constraint_backjumping_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_backjumping_getargs,
+          testanswer = solve_constraint_backjumping_testanswer,
+          expected_val = str(solve_constraint_backjumping_expected),
+          name = 'solve_constraint_backjumping')
+
+## randomized restarts
+#pokemon problem has a single solution; seed 0 always finds it in the same runs  #TEST 100
+solve_constraint_restarts_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 22)
+def solve_constraint_restarts_getargs() :
+    lab = get_lab_module()
+    return [get_pokemon_problem(), lab.condition_forward_checking,
+            lab.order_dom_wdeg, lab.luby, 2, 0]
+def solve_constraint_restarts_testanswer(val, original_val = None) :
+    return val == solve_constraint_restarts_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_constraint_restarts_getargs,
+          testanswer = solve_constraint_restarts_testanswer,
+          expected_val = str(solve_constraint_restarts_expected),
+          name = 'solve_constraint_restarts')
+
+## local search
+#min-conflicts reaches the pokemon problem's only solution  #TEST 101
+solve_min_conflicts_expected = {'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}
+def solve_min_conflicts_getargs() :
+    return [get_pokemon_problem(), 1000, None, 10, 0.02, 0]
+def solve_min_conflicts_testanswer(val, original_val = None) :
+    return val[0] == solve_min_conflicts_expected and val[2] == 0
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = solve_min_conflicts_getargs,
+          testanswer = solve_min_conflicts_testanswer,
+          expected_val = ("(" + str(solve_min_conflicts_expected)
+                          + ", <steps>, 0)"),
+          name = 'solve_min_conflicts')
+
+## incremental consistency check
+#C=1 only has to be checked against B=3, which it satisfies  #TEST 102
+check_new_assignment_expected = True
+def check_new_assignment_getargs() :
+    return [CSP_all_vars_assigned_inconsistent.copy(), 'C']
+def check_new_assignment_testanswer(val, original_val = None) :
+    return val == check_new_assignment_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = check_new_assignment_getargs,
+          testanswer = check_new_assignment_testanswer,
+          expected_val = str(check_new_assignment_expected),
+          name = 'check_new_assignment')
+
+## incremental empty-domain tracking
+#wiping out Q1's domain and then undoing it leaves no empty domain  #TEST 103
+has_empty_domains_undo_expected = False
+def has_empty_domains_undo_getargs() :
+    csp = get_pokemon_problem().start_trail()
+    mark = csp.checkpoint()
+    for val in csp.get_domain('Q1')[:] :
+        csp.eliminate('Q1', val)
+    csp.undo_to(mark)
+    return [csp]
+def has_empty_domains_undo_testanswer(val, original_val = None) :
+    return val == has_empty_domains_undo_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = has_empty_domains_undo_getargs,
+          testanswer = has_empty_domains_undo_testanswer,
+          expected_val = str(has_empty_domains_undo_expected),
+          name = 'has_empty_domains')
+
+#writing an empty domain straight into .domains is seen by has_empty_domains  #TEST 104
+has_empty_domains_direct_expected = True
+def has_empty_domains_direct_getargs() :
+    csp = get_pokemon_problem()
+    csp.domains['Q1'] = []
+    return [csp]
+def has_empty_domains_direct_testanswer(val, original_val = None) :
+    return val == has_empty_domains_direct_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = has_empty_domains_direct_getargs,
+          testanswer = has_empty_domains_direct_testanswer,
+          expected_val = str(has_empty_domains_direct_expected),
+          name = 'has_empty_domains')
+
+## copy-on-write copies
+#emptying the lists a copy hands out leaves the original solvable  #TEST 105
+copy_isolation_expected = {'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}
+def copy_isolation_getargs() :
+    csp = get_pokemon_problem()
+    child = csp.copy()
+    child.get_domain('Q1')[:] = []
+    del child.domains['Q2'][:]
+    return [csp]
+def copy_isolation_testanswer(val, original_val = None) :
+    return val[0] == copy_isolation_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = copy_isolation_getargs,
+          testanswer = copy_isolation_testanswer,
+          expected_val = ("(" + str(copy_isolation_expected)
+                          + ", <extensions>)"),
+          name = 'solve_constraint_forward_checking')
+
+## priority propagation
+#D shrinks below C's size while queued, so it moves ahead of C  #TEST 106
+propagate_priority_expected = ['B', 'D', 'C']
+def propagate_priority_getargs() :
+    lab = get_lab_module()
+    csp = CSP(list('BCD')).set_all_domains({'B':[1,2], 'C':[1,2,3],
+                                            'D':[1,2,3,4]})
+    csp.add_constraint('B', 'D', constraint_equal)
+    return [lab.condition_domain_reduction, csp, ['C','D','B'], None,
+            lab.order_mrv]
+def propagate_priority_testanswer(val, original_val = None) :
+    return val == propagate_priority_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = propagate_priority_getargs,
+          testanswer = propagate_priority_testanswer,
+          expected_val = str(propagate_priority_expected),
+          name = 'propagate')
+
+#the cost scheduler propagates the singleton Q3 first  #TEST 107
+propagate_cost_expected = ['Q3', 'Q5', 'Q4', 'Q5', 'Q2', 'Q1', 'Q2']
+def propagate_cost_getargs() :
+    lab = get_lab_module()
+    return [lab.condition_domain_reduction,
+            get_pokemon_problem().set_assignment('Q3','D'), None, None,
+            lab.CostScheduler()]
+def propagate_cost_testanswer(val, original_val = None) :
+    return val == propagate_cost_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = propagate_cost_getargs,
+          testanswer = propagate_cost_testanswer,
+          expected_val = str(propagate_cost_expected),
+          name = 'propagate')
+
+#scheduling by cost saves 6 of the 19 FIFO revisions  #TEST 108
+propagation_savings_expected = {'fifo': {'revisions': 19, 'checks': 0},
+                                'priority': {'revisions': 13, 'checks': 0},
+                                'revisions_saved': 6, 'checks_saved': 0}
+def propagation_savings_getargs() :
+    lab = get_lab_module()
+    return [lab.condition_domain_reduction,
+            get_pokemon_problem().set_assignment('Q3','D')]
+def propagation_savings_testanswer(val, original_val = None) :
+    return val == propagation_savings_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = propagation_savings_getargs,
+          testanswer = propagation_savings_testanswer,
+          expected_val = str(propagation_savings_expected),
+          name = 'propagation_savings')
+
+## value ordering
+#A=3 rules out only B=3, while A=1 and A=2 each rule out one value of B and of C  #TEST 109
+order_lcv_expected = [3, 1, 2]
+def order_lcv_getargs() :
+    csp = CSP(list('ABC')).set_all_domains({'A':[1,2,3], 'B':[1,2,3],
+                                            'C':[1,2]})
+    csp.add_constraints([Constraint('A','B',constraint_different),
+                         Constraint('A','C',constraint_different)])
+    return [csp, 'A']
+def order_lcv_testanswer(val, original_val = None) :
+    return val == order_lcv_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = order_lcv_getargs,
+          testanswer = order_lcv_testanswer,
+          expected_val = str(order_lcv_expected),
+          name = 'order_lcv')
+
+## compact domain store
+#the bitmask store finds the same solution in the same number of extensions  #TEST 110
+compact_fc_expected = ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 9)
+def compact_fc_getargs() :
+    return [get_pokemon_problem().use_compact_domains()]
+def compact_fc_testanswer(val, original_val = None) :
+    return val == compact_fc_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = compact_fc_getargs,
+          testanswer = compact_fc_testanswer,
+          expected_val = str(compact_fc_expected),
+          name = 'solve_constraint_forward_checking')
+
+#restoring a snapshot undoes a wipeout, even after the domain was set again  #TEST 111
+compact_restore_expected = ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 20)
+def compact_restore_getargs() :
+    csp = get_pokemon_problem().use_compact_domains()
+    snapshot = csp.snapshot()
+    csp.set_domain('Q1', [])
+    csp.restore(snapshot)
+    return [csp]
+def compact_restore_testanswer(val, original_val = None) :
+    return val == compact_restore_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = compact_restore_getargs,
+          testanswer = compact_restore_testanswer,
+          expected_val = str(compact_restore_expected),
+          name = 'solve_constraint_dfs')
+
+#domain_size counts the live bits after an elimination  #TEST 112
+compact_size_expected = 3
+def compact_size_getargs() :
+    csp = get_pokemon_problem().use_compact_domains()
+    csp.eliminate('Q1', 'A')
+    return [csp, 'Q1']
+def compact_size_testanswer(val, original_val = None) :
+    return val == compact_size_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = compact_size_getargs,
+          testanswer = compact_size_testanswer,
+          expected_val = str(compact_size_expected),
+          name = 'order_mrv')
+
+## compiled support tables
+#with tables compiled, revising B gives the same reduction without calling the function  #TEST 113
+supports_calls = []
+def supports_less_than(a, b) :
+    supports_calls.append((a, b))
+    return a < b
+eliminate_with_supports_expected = ['B']
+def eliminate_with_supports_getargs() :
+    csp = CSP(list('AB')).set_all_domains({'A':[1,2,3], 'B':[1,2,3]})
+    csp.add_constraint('A', 'B', supports_less_than)
+    csp.compile_supports()
+    csp.set_domain('A', [2,3])
+    del supports_calls[:]
+    return [csp, 'A']
+def eliminate_with_supports_testanswer(val, original_val = None) :
+    return val == eliminate_with_supports_expected and supports_calls == []
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = eliminate_with_supports_getargs,
+          testanswer = eliminate_with_supports_testanswer,
+          expected_val = (str(eliminate_with_supports_expected)
+                          + ' (with no constraint function calls)'),
+          name = 'eliminate_from_neighbors')
+
+## constraint weights
+#solving a problem again makes the same extensions: each search learns weights on its own copy  #TEST 114
+dom_wdeg_first_run = []
+dom_wdeg_repeat_expected = 7
+def dom_wdeg_repeat_getargs() :
+    lab = get_lab_module()
+    csp = CSP(['V0','V1','V2','V3','V4']).set_all_domains(
+        {'V0':[0,1], 'V1':[0,1,2], 'V2':[0,1], 'V3':[0,1,2], 'V4':[0,1,2,3]})
+    for (var1, var2) in [('V1','V2'), ('V0','V4'), ('V1','V4'), ('V0','V1'),
+                         ('V3','V0'), ('V2','V0')]:
+        csp.add_constraint(var1, var2, constraint_different)
+    dom_wdeg_first_run[:] = [lab.solve_constraint_generic(
+        csp, lab.condition_forward_checking, lab.order_dom_wdeg)[1]]
+    return [csp, lab.condition_forward_checking, lab.order_dom_wdeg]
+def dom_wdeg_repeat_testanswer(val, original_val = None) :
+    return dom_wdeg_first_run == [val[1]] == [dom_wdeg_repeat_expected]
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = dom_wdeg_repeat_getargs,
+          testanswer = dom_wdeg_repeat_testanswer,
+          expected_val = ("(<solution>, " + str(dom_wdeg_repeat_expected)
+                          + ") on both solves"),
+          name = 'solve_constraint_generic')
+
+## decomposition, continued
+#components keep each domain's own value order, even one that cannot be sorted  #TEST 115
+decomposed_value_order_expected = ({'A':None, 'B':2}, 3)
+def decomposed_value_order_getargs() :
+    csp = CSP(list('AB')).set_all_domains({'A':[None,1], 'B':[2,1]})
+    csp.add_constraint('A', 'B', constraint_different)
+    return [csp, None, None, None, 1]
+def decomposed_value_order_testanswer(val, original_val = None) :
+    return val == decomposed_value_order_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = decomposed_value_order_getargs,
+          testanswer = decomposed_value_order_testanswer,
+          expected_val = str(decomposed_value_order_expected),
+          name = 'solve_constraint_decomposed')
+
+## copies
+#assigning through a copy's .assignments and .unassigned_vars leaves the original alone  #TEST 116
+copy_attribute_isolation_expected = \
+    ({'Q1':'B', 'Q3':'D', 'Q2':'B', 'Q5':'C', 'Q4':'C'}, 9)
+def copy_attribute_isolation_getargs() :
+    csp = get_pokemon_problem()
+    child = csp.copy()
+    child.assignments['Q1'] = 'A'
+    child.unassigned_vars.remove('Q2')
+    return [csp]
+def copy_attribute_isolation_testanswer(val, original_val = None) :
+    return val == copy_attribute_isolation_expected
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = copy_attribute_isolation_getargs,
+          testanswer = copy_attribute_isolation_testanswer,
+          expected_val = str(copy_attribute_isolation_expected),
+          name = 'solve_constraint_forward_checking')
+
+## built-in constraints
+#constraint_equal and constraint_different are revised by comparing domains, as the generic revision would  #TEST 117
+def same_value(a, b) :
+    return a == b
+def other_value(a, b) :
+    return a != b
+def native_pair_problem(equal_fn, different_fn, A_domain) :
+    csp = CSP(list('ABCD')).set_all_domains(
+        {'A':A_domain, 'B':[1,2,3], 'C':[1,2], 'D':[0,1,2]})
+    csp.add_constraint('A', 'B', different_fn)
+    csp.add_constraint('A', 'C', equal_fn).add_constraint('A', 'C', different_fn)
+    csp.add_constraint('A', 'D', equal_fn)
+    return csp
+def native_pair_domains(csp) :
+    return dict((var, csp.get_domain(var)) for var in 'BCD')
+native_revision_problems = []
+def native_revision_getargs() :
+    csp = native_pair_problem(constraint_equal, constraint_different, [1])
+    native_revision_problems[:] = [csp]
+    return [csp, 'A']
+def native_revision_testanswer(val, original_val = None) :
+    lab = get_lab_module()
+    generic = native_pair_problem(same_value, other_value, [1])
+    if val != lab.eliminate_from_neighbors(generic, 'A'):
+        return False
+    if native_pair_domains(native_revision_problems[0]) != native_pair_domains(generic):
+        return False
+    # empty domain for A: nothing in B, C or D has support
+    native = native_pair_problem(constraint_equal, constraint_different, [])
+    generic = native_pair_problem(same_value, other_value, [])
+    return (lab.eliminate_from_neighbors(native, 'A')
+            == lab.eliminate_from_neighbors(generic, 'A')
+            and native_pair_domains(native) == native_pair_domains(generic))
+make_test(type = 'FUNCTION_ENCODED_ARGS',
+          getargs = native_revision_getargs,
+          testanswer = native_revision_testanswer,
+          expected_val = ('None, with the same reduced domains as with '
+                          + 'user-defined equal/different functions'),
+          name = 'eliminate_from_neighbors')